@@ -1,12 +1,27 @@
+import io
 import os
 import re
+import stat
 import sys
 import shutil
 import subprocess
 import datetime
 import argparse
+import fnmatch
+import contextlib
+import hashlib
+import time
+import json
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-import binascii  # デバッグ出力用に追加
+try:
+    import fcntl  # メトリクスファイルの排他用（Windowsでは使用できない）
+except ImportError:
+    fcntl = None
+import binascii  # バイナリファイル（base64）のデコード用
+import zlib
 
 # スクリプトのバージョン
 VERSION = "2.1.3"
@@ -14,16 +29,550 @@ VERSION = "2.1.3"
 # 処理から除外するファイル拡張子
 EXCLUDED_EXTENSIONS = ['.json', '.env', '.lock', '.md', '.gitignore', '.gitkeep', '.git', '.DS_Store']
 
+# 構文チェックに使う外部コマンド（拡張子 → コマンド。ファイルパスは末尾に付与される）
+# .py は外部コマンドを使わず compile() でチェックする
+SYNTAX_CHECKERS = {
+    '.php': ['php', '-l'],
+    '.js': ['node', '--check'],
+    '.mjs': ['node', '--check'],
+    '.cjs': ['node', '--check'],
+    '.rb': ['ruby', '-wc'],
+    '.sh': ['bash', '-n'],
+    '.pl': ['perl', '-c'],
+}
+
+def register_syntax_checker(ext, command):
+    """拡張子に対応する外部構文チェッカーを登録する（例: register_syntax_checker('.ts', ['tsc', '--noEmit'])）"""
+    SYNTAX_CHECKERS[ext.lower()] = list(command)
+
 def is_excluded_file(file_path):
     """ファイルが処理から除外されるかどうかを判定する"""
     _, ext = os.path.splitext(file_path.lower())
     return ext in EXCLUDED_EXTENSIONS
 
+class EntryFilter:
+    """ファイル一覧のエントリをファイルパスのグロブまたはファイルIDで絞り込むクラス
+    
+    パターンが5桁の数字の場合はファイルID、それ以外はファイルパスのグロブ（fnmatch）として扱う。
+    only を指定した場合はいずれかに一致するエントリのみ、exclude に一致するエントリは除外する
+    """
+    
+    def __init__(self, only=None, exclude=None):
+        self.only = list(only or [])
+        self.exclude = list(exclude or [])
+    
+    def __bool__(self):
+        return bool(self.only or self.exclude)
+    
+    @staticmethod
+    def _match(pattern, file_id, file_path):
+        if re.fullmatch(r'\d{5}', pattern):
+            return pattern == file_id
+        return fnmatch.fnmatchcase(file_path.strip().replace('\\', '/'), pattern)
+    
+    def matches(self, file_id, file_path):
+        """エントリを適用対象とするかどうかを判定する"""
+        if self.only and not any(self._match(pattern, file_id, file_path) for pattern in self.only):
+            return False
+        return not any(self._match(pattern, file_id, file_path) for pattern in self.exclude)
+    
+    def to_dict(self):
+        return {"only": self.only, "exclude": self.exclude}
+    
+    def describe(self):
+        parts = []
+        if self.only:
+            parts.append(f"--only {' '.join(self.only)}")
+        if self.exclude:
+            parts.append(f"--exclude {' '.join(self.exclude)}")
+        return ", ".join(parts)
+
 def print_info(message, always_show=True):
     """情報メッセージを表示する。always_showがTrueまたはデバッグモードが有効な場合のみ表示"""
     if always_show or debug_logger.enabled:
         print(message)
 
+# 対話プロンプトの排他用ロック（パイプライン実行時に複数スレッドから入力を求めないため）
+prompt_lock = threading.Lock()
+
+def ask_user(message, notice=()):
+    """ユーザーに入力を求める。複数スレッドから同時に呼ばれても順番に表示する
+    
+    notice（プロンプトの前に表示する警告などの行）もロックを保持したまま表示し、
+    他のスレッドのプロンプトの途中に割り込まないようにする
+    """
+    with prompt_lock:
+        for line in notice:
+            print_info(line)
+        return input(message)
+
+# 差分形式の修正セクション（#### 差分 #アンカーのコード管理番号）
+DIFF_SECTION_PATTERN = r'####\s+差分\s+#(\d{5}_[a-z]{5})\s*\n```diff\n([\s\S]*?)```'
+DIFF_HUNK_HEADER_PATTERN = r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@'
+
+def parse_diff_hunks(diff_text):
+    """unified diff 形式のハンクを解析する。形式が不正な場合は ValueError を送出する
+    
+    行番号はアンカー（コード管理番号）の行を1行目とした相対行番号として扱う
+    """
+    hunks = []
+    current = None
+    lines = diff_text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    for line_no, line in enumerate(lines, 1):
+        if line.startswith('@@'):
+            header = re.match(DIFF_HUNK_HEADER_PATTERN, line)
+            if not header:
+                raise ValueError(f"{line_no}行目: ハンクヘッダーの形式が不正です: {line}")
+            old_count = int(header.group(2)) if header.group(2) is not None else 1
+            new_count = int(header.group(4)) if header.group(4) is not None else 1
+            current = {"old_start": int(header.group(1)), "old_count": old_count,
+                       "new_start": int(header.group(3)), "new_count": new_count, "lines": []}
+            hunks.append(current)
+        elif line.startswith(('---', '+++')) and current is None:
+            # ファイルヘッダーは無視する（対象ファイルはセクション見出しで指定済み）
+            continue
+        elif current is None:
+            raise ValueError(f"{line_no}行目: ハンクヘッダー（@@ -l,n +l,n @@）より前に内容があります")
+        elif line.startswith('\\'):
+            # "\ No newline at end of file"
+            current["lines"].append(('\\', ''))
+        elif line == '':
+            # 空行のコンテキスト（末尾の空白が削除されている場合）
+            current["lines"].append((' ', ''))
+        elif line[0] in ' -+':
+            current["lines"].append((line[0], line[1:]))
+        else:
+            raise ValueError(f"{line_no}行目: 行頭は ' '、'-'、'+' のいずれかである必要があります: {line}")
+    
+    if not hunks:
+        raise ValueError("ハンクが見つかりません")
+    for hunk in hunks:
+        old_lines = sum(1 for tag, _ in hunk["lines"] if tag in ' -')
+        new_lines = sum(1 for tag, _ in hunk["lines"] if tag in ' +')
+        if old_lines != hunk["old_count"] or new_lines != hunk["new_count"]:
+            raise ValueError(f"ハンク @@ -{hunk['old_start']},{hunk['old_count']} +{hunk['new_start']},{hunk['new_count']} @@ の行数が"
+                             f"ヘッダーと一致しません（変更前 {old_lines} 行、変更後 {new_lines} 行）")
+    return hunks
+
+def apply_diff_hunks(content, diff_sections, newline='\n'):
+    """差分ハンクをコード管理番号の位置を基準に、1回の走査でまとめて適用する
+    
+    diff_sections は [(アンカーのコード管理番号（#付き）, ハンクのリスト)]。
+    content・アンカー・ハンクの各行・newline は、すべて str またはすべて bytes で指定する。
+    (新しい内容, 適用したハンク数, スキップしたハンクの説明のリスト) を返す
+    """
+    line_endings = '\r\n' if isinstance(content, str) else b'\r\n'
+    lines = content.splitlines(keepends=True)
+    stripped = [line.rstrip(line_endings) for line in lines]
+    resolved = []
+    skipped = []
+    
+    for anchor, hunks in diff_sections:
+        anchor_name = anchor if isinstance(anchor, str) else anchor.decode('ascii', errors='replace')
+        anchor_index = next((i for i, line in enumerate(stripped) if anchor in line), -1)
+        if anchor_index == -1:
+            skipped.extend(f"アンカー '{anchor_name}' が見つかりません" for _ in hunks)
+            continue
+        for hunk in hunks:
+            old = [text for tag, text in hunk["lines"] if tag in ' -']
+            if not old:
+                # 純粋な追加: 相対行番号の行の直後に挿入する
+                resolved.append((anchor_index + hunk["old_start"], 0, anchor_name, hunk))
+                continue
+            # ヘッダーの行番号の位置を優先し、一致しなければアンカー以降を検索する
+            expected = anchor_index + hunk["old_start"] - 1
+            candidates = [expected] + [i for i in range(anchor_index, len(stripped) - len(old) + 1) if i != expected]
+            pos = next((i for i in candidates if stripped[i:i + len(old)] == old), -1)
+            if pos == -1:
+                skipped.append(f"アンカー '{anchor_name}' 以降にハンク @@ -{hunk['old_start']},{hunk['old_count']} @@ のコンテキストが一致しません")
+                continue
+            resolved.append((pos, len(old), anchor_name, hunk))
+    
+    # 位置順に並べ、重なるハンクはスキップして1回の走査で新しい内容を組み立てる
+    resolved.sort(key=lambda item: item[0])
+    result = []
+    cursor = 0
+    applied = 0
+    for pos, length, anchor_name, hunk in resolved:
+        if pos < cursor:
+            skipped.append(f"アンカー '{anchor_name}' のハンク @@ -{hunk['old_start']},{hunk['old_count']} @@ が他のハンクと重なっています")
+            continue
+        result.extend(lines[cursor:pos])
+        index = pos
+        previous_tag = None
+        for tag, text in hunk["lines"]:
+            if tag == ' ':
+                result.append(lines[index])
+                index += 1
+            elif tag == '-':
+                index += 1
+            elif tag == '+':
+                result.append(text + newline)
+            elif tag == '\\' and previous_tag in (' ', '+'):
+                # 「\ No newline at end of file」は直前の行のみに対応する（削除した行の場合は出力に影響しない）
+                result[-1] = result[-1].rstrip(line_endings)
+            previous_tag = tag
+        cursor = pos + length
+        applied += 1
+    result.extend(lines[cursor:])
+    return content[:0].join(result), applied, skipped
+
+
+# バイナリファイルのコードブロック（base64、または圧縮してから base64 にしたもの）
+BINARY_BLOCK_PATTERN = r'```(base64(?:-gzip|-zlib)?)\n([\s\S]*?)```'
+BINARY_INFO_PATTERN = r'バイナリ情報：size=(\d+),sha256=([0-9a-fA-F]{64})'
+# デコード時に一度に読み込む base64 の文字数（4の倍数）
+BINARY_CHUNK_SIZE = 64 * 1024
+
+def iter_binary_payload(source, start, end, encoding, max_size=None):
+    """source[start:end] の base64 ペイロードをチャンクごとにデコードして bytes を順に返す
+    
+    ペイロード全体を一度に文字列やバイト列として切り出さない。
+    max_size を超えるデータになった場合は ValueError を送出する
+    """
+    if encoding == "base64-gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == "base64-zlib":
+        decompressor = zlib.decompressobj()
+    else:
+        decompressor = None
+    
+    pending = ""
+    produced = 0
+    pos = start
+    while pos < end:
+        chunk = source[pos:min(pos + BINARY_CHUNK_SIZE, end)]
+        pos += len(chunk)
+        chunk = pending + "".join(chunk.split())
+        if not re.fullmatch(r'[A-Za-z0-9+/=]*', chunk):
+            raise ValueError("base64 として不正な文字が含まれています")
+        usable = len(chunk) - len(chunk) % 4
+        pending = chunk[usable:]
+        data = binascii.a2b_base64(chunk[:usable])
+        if decompressor:
+            data = decompressor.decompress(data, (max_size + 1 - produced) if max_size is not None else 0)
+        produced += len(data)
+        if max_size is not None and produced > max_size:
+            raise ValueError(f"デコードしたデータが宣言されたサイズ {max_size} バイトを超えています")
+        if data:
+            yield data
+    
+    if pending:
+        raise ValueError("base64 のデータ長が不正です")
+    if decompressor:
+        data = decompressor.flush()
+        produced += len(data)
+        if max_size is not None and produced > max_size:
+            raise ValueError(f"デコードしたデータが宣言されたサイズ {max_size} バイトを超えています")
+        if data:
+            yield data
+        if not decompressor.eof:
+            raise ValueError("圧縮データが途中で終わっています")
+
+# BOM とそのエンコーディング（UTF-16 は BOM がある場合のみ対応）
+TEXT_BOMS = [
+    (b'\xef\xbb\xbf', 'utf-8'),
+    (b'\xff\xfe', 'utf-16-le'),
+    (b'\xfe\xff', 'utf-16-be'),
+]
+# BOM がない場合に試すエンコーディング
+# UTF-8 は厳密にデコードできれば採用する。それ以外は厳密にデコードできたものを日本語らしさで比較する
+# （EUC-JP のかな・漢字は cp932 の半角カナの並びとしてもデコードできてしまうため、先にデコードできたものは採用しない）
+FALLBACK_ENCODINGS = ['utf-8', 'cp932', 'euc_jp']
+# 日本語のテキストとして自然な文字（全角記号・ひらがな・カタカナ・漢字・全角英数字）
+JAPANESE_TEXT_PATTERN = re.compile(r'[\u3000-\u30ff\u4e00-\u9fff\uff01-\uff5e]')
+# かな（全角のひらがな・カタカナ）。日本語の文章にはほぼ必ず含まれる
+KANA_PATTERN = re.compile(r'[\u3041-\u30ff]')
+# 半角カナ（cp932 では正しい文字のため、加点も減点もしない）
+HALFWIDTH_KANA_PATTERN = re.compile(r'[\uff61-\uff9f]')
+NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7f]')
+
+def score_japanese_text(text):
+    """デコードした結果の日本語らしさ（自然な文字は加点、半角カナ以外の不自然な記号などは減点）"""
+    natural = len(JAPANESE_TEXT_PATTERN.findall(text))
+    neutral = len(HALFWIDTH_KANA_PATTERN.findall(text))
+    return natural - (len(NON_ASCII_PATTERN.findall(text)) - natural - neutral)
+
+def is_clearly_better_reading(text, other):
+    """text の方が other より明らかに日本語のテキストらしいかどうか
+    
+    かなを含むのが一方だけの場合はそちら、どちらも同じ場合は other に不自然な文字があり text の点数が高い場合のみ
+    """
+    has_kana, other_has_kana = bool(KANA_PATTERN.search(text)), bool(KANA_PATTERN.search(other))
+    if has_kana != other_has_kana:
+        return has_kana
+    return score_japanese_text(other) < 0 and score_japanese_text(text) > score_japanese_text(other)
+
+def detect_text_format(data, need_encoding=True):
+    """ファイルのエンコーディング・BOM・改行コードを判定する
+    
+    need_encoding が False で BOM もない場合は、ASCII 互換として扱いデコードによる判定を省略する
+    （encoding は None になる）
+    
+    かなのみの EUC-JP も cp932 と誤判定せず、cp932 と EUC-JP のどちらとも解釈できる場合は中止する
+    （python3 -m doctest parser.py で確認できる）:
+    
+    >>> detect_text_format('あいうえお'.encode('euc_jp'))['encoding']
+    'euc_jp'
+    >>> detect_text_format('ユーザー名を入力してください\\r\\n'.encode('euc_jp'))
+    {'encoding': 'euc_jp', 'bom': b'', 'newline': '\\r\\n'}
+    >>> detect_text_format('テスト'.encode('cp932'))['encoding']
+    'cp932'
+    >>> detect_text_format('echo "ｱｲｳｴ";\\n'.encode('cp932'))
+    Traceback (most recent call last):
+        ...
+    ValueError: エンコーディングを判定できません（cp932 と euc_jp のどちらとも解釈できます）
+    """
+    bom = b''
+    encoding = None
+    for bom_bytes, bom_encoding in TEXT_BOMS:
+        if data.startswith(bom_bytes):
+            bom, encoding = bom_bytes, bom_encoding
+            break
+    if encoding is None and need_encoding:
+        decoded = {}
+        for candidate in FALLBACK_ENCODINGS:
+            try:
+                decoded[candidate] = data.decode(candidate)
+            except UnicodeDecodeError:
+                continue
+            if candidate == 'utf-8':
+                break
+        if not decoded:
+            raise ValueError(f"エンコーディングを判定できません（{', '.join(FALLBACK_ENCODINGS)} のいずれでもありません）")
+        candidates = list(decoded)
+        encoding = candidates[0]
+        if len(candidates) > 1 and decoded[candidates[0]] != decoded[candidates[1]]:
+            first, second = candidates[:2]
+            if is_clearly_better_reading(decoded[second], decoded[first]):
+                encoding = second
+            elif not is_clearly_better_reading(decoded[first], decoded[second]):
+                # どちらとも判断できない場合は、誤ったエンコーディングで書き込まないよう中止する
+                raise ValueError(f"エンコーディングを判定できません（{first} と {second} のどちらとも解釈できます）")
+    
+    # 最初の改行で改行コードを判定する
+    codec = encoding or 'ascii'
+    lf = '\n'.encode(codec)
+    cr = '\r'.encode(codec)
+    pos = data.find(lf, len(bom))
+    newline = '\r\n' if pos >= len(cr) and data[pos - len(cr):pos] == cr else '\n'
+    return {"encoding": encoding, "bom": bom, "newline": newline}
+
+def encode_text(text, text_format):
+    """手順書の内容（改行は \\n）を対象ファイルの改行コード・エンコーディングに変換する"""
+    if text_format["newline"] != '\n':
+        text = text.replace('\n', text_format["newline"])
+    return text.encode(text_format["encoding"] or 'ascii')
+
+def decode_preview(data, text_format, length=100):
+    """表示用に先頭部分をデコードする"""
+    return data[:length * 4].decode(text_format["encoding"] or 'utf-8', errors='replace')[:length]
+
+def render_text_file(content, existing=None, file_path=""):
+    """新規ファイルの内容をバイト列にする（既存ファイルを上書きする場合はその形式を引き継ぐ）"""
+    text_format = {"encoding": 'utf-8', "bom": b'', "newline": '\n'}
+    if existing is not None:
+        try:
+            text_format = detect_text_format(existing, not content.isascii())
+        except ValueError as e:
+            debug_logger.log(f"既存ファイル {file_path} の形式を引き継げません（UTF-8で書き込みます）: {e}")
+        if text_format["encoding"] is None:
+            text_format = dict(text_format, encoding='utf-8')
+        debug_logger.log(f"既存ファイルの形式を引き継ぎます: エンコーディング={text_format['encoding']}, "
+                         f"BOM={'あり' if text_format['bom'] else 'なし'}, 改行={text_format['newline']!r}")
+    return text_format["bom"] + encode_text(content, text_format)
+
+def render_run_script(run_commands):
+    """実行スクリプトのファイル名と内容を返す（Windows は bat、それ以外は sh）"""
+    if os.name == 'nt':  # Windows
+        return "run.bat", "@echo off\n" + "".join(f"{cmd}\n" for cmd in run_commands)
+    return "run.sh", "#!/bin/bash\n" + "".join(f"{cmd}\n" for cmd in run_commands)
+
+# コード管理番号（区間の区切り）。get_marker_patterns のコメント形式（<!-- // /* #）に続くものだけを対象とし、
+# CSS の色指定や本文中の「#12345」は区切りとみなさない
+MARKER_PATTERN = re.compile(r'(?:<!--|//|/\*|#)[ \t]*#(\d{5}(?:_[a-z]{5})?)(?![0-9A-Za-z_])')
+
+def split_marker_regions(text):
+    """テキストをコード管理番号ごとの区間に分割する（コード管理番号から次のコード管理番号の手前まで）
+    
+    [(コード管理番号, 区間の内容)] を返す。最初のコード管理番号より前の部分は含まない
+    
+    >>> [code for code, _ in split_marker_regions("a { color: #12345a; }\\n/* #00001 */\\nissue #12345\\n# #00002_abcde\\n")]
+    ['00001', '00002_abcde']
+    """
+    positions = [(match.start(), match.group(1)) for match in MARKER_PATTERN.finditer(text)]
+    return [(code, text[pos:positions[i + 1][0] if i + 1 < len(positions) else len(text)])
+            for i, (pos, code) in enumerate(positions)]
+
+def normalize_text(data):
+    """区間の比較用に、バイト列を BOM なし・改行 \\n の文字列にする"""
+    try:
+        text_format = detect_text_format(data)
+        text = data[len(text_format["bom"]):].decode(text_format["encoding"])
+    except ValueError:
+        text = data.decode('utf-8', errors='replace')
+    return text.replace('\r\n', '\n')
+
+def hash_marker_regions(text):
+    """コード管理番号ごとの区間のハッシュを返す（同じ番号が複数ある場合は最初の区間）"""
+    regions = {}
+    for code, region in split_marker_regions(text):
+        regions.setdefault(code, hashlib.sha256(region.encode('utf-8')).hexdigest())
+    return regions
+
+def get_marker_patterns(file_path, code):
+    """ファイル種別に応じたコード管理番号の検索パターンを優先順に返す"""
+    # ファイル拡張子からファイル種別を判断
+    _, ext = os.path.splitext(file_path.lower())
+    
+    # HTML/XMLファイル用パターン
+    if ext in ['.html', '.htm', '.xml', '.svg']:
+        return [
+            f"<!-- #{code} -->",  # HTMLコメント形式
+            f"#{code}",           # 単純な形式（フォールバック）
+        ]
+    # CSSファイル用パターン
+    if ext in ['.css']:
+        return [
+            f"/* #{code} */",     # CSSコメント形式
+            f"#{code}",           # 単純な形式（フォールバック）
+        ]
+    # PHPやJavaScript等のC系言語用パターン
+    if ext in ['.php', '.js', '.ts', '.java', '.cs', '.cpp', '.c', '.h']:
+        return [
+            f"// #{code}",        # 単一行コメント形式
+            f"/* #{code} */",     # 複数行コメント形式
+            f"#{code}",           # 単純な形式（フォールバック）
+        ]
+    # Python、Ruby、シェルスクリプト用パターン
+    if ext in ['.py', '.rb', '.sh', '.yml', '.yaml']:
+        return [
+            f"# #{code}",         # シャープコメント形式
+            f"#{code}",           # 単純な形式（フォールバック）
+        ]
+    # デフォルトパターン（すべての形式を試す）
+    return [
+        f"<!-- #{code} -->",  # HTMLコメント形式
+        f"// #{code}",        # 単一行コメント形式
+        f"/* #{code} */",     # 複数行コメント形式
+        f"# #{code}",         # シャープコメント形式
+        f"#{code}",           # 単純な形式（フォールバック）
+    ]
+
+def find_marker(content, patterns, text_format, start=0):
+    """パターンを順に試してマーカーを検索する。(位置, 使用したパターン, エンコード後の長さ) を返す"""
+    for pattern in patterns:
+        debug_logger.log(f"パターン '{pattern}' でマーカーを検索")
+        pos = content.find(encode_text(pattern, text_format), start)
+        if pos != -1:
+            return pos, pattern, len(encode_text(pattern, text_format))
+    return -1, None, 0
+
+def splice_modifications(content, file_path, modifications):
+    """ファイル内容（バイト列）に修正区間・差分を適用する。(新しい内容, 変更の有無) を返す
+    
+    コード管理番号は ASCII のため、マーカーの検索と置き換えはデコードせずにバイト列のまま行う。
+    置き換える内容に ASCII 以外の文字が含まれる場合や BOM がある場合のみエンコーディングを判定し、
+    置き換える内容だけを元のファイルのエンコーディング・改行コードに変換する
+    """
+    need_encoding = any(not mod["content"].isascii() for mod in modifications)
+    text_format = detect_text_format(content, need_encoding)
+    debug_logger.log(f"ファイル形式: エンコーディング={text_format['encoding'] or 'ASCII互換（未判定）'}, "
+                     f"BOM={'あり' if text_format['bom'] else 'なし'}, 改行={text_format['newline']!r}")
+    
+    # 変更フラグ
+    changed = False
+    
+    # 差分形式の修正は、すべてのハンクを1回の走査でまとめて適用する
+    diff_mods = [mod for mod in modifications if mod.get("type") == "diff"]
+    if diff_mods:
+        if (text_format["encoding"] or '').startswith('utf-16'):
+            # UTF-16 は改行が2バイトで行をバイト列のまま分割できないため、デコードして適用し再エンコードする
+            bom, encoding = text_format["bom"], text_format["encoding"]
+            diff_sections = [(f"#{mod['anchor']}", mod["hunks"]) for mod in diff_mods]
+            text, applied, skipped = apply_diff_hunks(content[len(bom):].decode(encoding), diff_sections,
+                                                      text_format["newline"])
+            if applied:
+                content = bom + text.encode(encoding)
+        else:
+            diff_sections = []
+            for mod in diff_mods:
+                hunks = [dict(hunk, lines=[(tag, encode_text(text, text_format)) for tag, text in hunk["lines"]])
+                         for hunk in mod["hunks"]]
+                diff_sections.append((encode_text(f"#{mod['anchor']}", text_format), hunks))
+            content, applied, skipped = apply_diff_hunks(content, diff_sections, encode_text('\n', text_format))
+        metrics.inc("procedure_parser_skipped_modifications_total", value=len(skipped))
+        for message in skipped:
+            debug_logger.log(f"{message}。このハンクはスキップします。")
+            print_info(f"★{message}。このハンクはスキップします。")
+        debug_logger.log(f"差分ハンクを適用しました: {applied} 件（スキップ {len(skipped)} 件）")
+        print_info(f"差分ハンクを適用しました: {applied} 件")
+        if applied:
+            changed = True
+    
+    # 各修正区間を処理
+    for mod in modifications:
+        if mod.get("type") == "diff":
+            continue
+        start_code = mod["start"]
+        end_code = mod["end"]
+        new_content = mod["content"]
+        
+        debug_logger.log(f"修正処理: コード管理番号 #{start_code}-#{end_code}")
+        print_info(f"修正処理: コード管理番号 #{start_code}-#{end_code}")
+        
+        # 開始マーカーを検索
+        start_pos, start_marker_used, start_marker_length = find_marker(
+            content, get_marker_patterns(file_path, start_code), text_format)
+        
+        if start_pos == -1:
+            metrics.inc("procedure_parser_skipped_modifications_total")
+            debug_logger.log(f"開始マーカー '#{start_code}' が見つかりません。この修正はスキップします。")
+            print_info(f"★開始マーカー '#{start_code}' が見つかりません。この修正はスキップします。")
+            continue
+        
+        debug_logger.log(f"開始マーカー '{start_marker_used}' を位置 {start_pos} で見つけました")
+        print_info(f"開始マーカー '{start_marker_used}' を位置 {start_pos} で見つけました")
+        
+        # 終了マーカーを検索 (開始位置以降を検索)
+        end_pos, end_marker_used, end_marker_length = find_marker(
+            content, get_marker_patterns(file_path, end_code), text_format, start_pos + start_marker_length)
+        
+        if end_pos == -1:
+            metrics.inc("procedure_parser_skipped_modifications_total")
+            debug_logger.log(f"終了マーカー '#{end_code}' が見つかりません。この修正はスキップします。")
+            print_info(f"★終了マーカー '#{end_code}' が見つかりません。この修正はスキップします。")
+            continue
+        
+        debug_logger.log(f"終了マーカー '{end_marker_used}' を位置 {end_pos} で見つけました")
+        print_info(f"終了マーカー '{end_marker_used}' を位置 {end_pos} で見つけました")
+        
+        # 終了マーカーのサイズを加える
+        end_pos += end_marker_length
+        
+        # この範囲を新しい内容で置き換え
+        before = content[start_pos:end_pos]
+        debug_logger.log(f"置換前の内容: {decode_preview(before, text_format, 200)}...")
+        debug_logger.log_file_content(f"{file_path}_replace_before.txt", before)
+        print_info(f"置換前の内容: {decode_preview(before, text_format)}...")
+        
+        # 新しい内容を出力
+        preview = new_content[:100] + ("..." if len(new_content) > 100 else "")
+        debug_logger.log(f"新しい内容: {preview}")
+        debug_logger.log_file_content(f"{file_path}_replace_after.txt", new_content)
+        print_info(f"新しい内容: {preview}")
+        
+        # 置換を実行（置き換える内容のみ元のファイルの形式に変換する）
+        content = content[:start_pos] + encode_text(new_content, text_format) + content[end_pos:]
+        changed = True
+        
+        debug_logger.log(f"置換が完了しました")
+        print_info(f"置換が完了しました")
+    
+    return content, changed
+
 # デバッグ用のログ記録
 class DebugLogger:
     def __init__(self, enabled=False):
@@ -64,8 +613,12 @@ class DebugLogger:
             base_name = os.path.basename(filename)
             log_path = os.path.join(self.log_dir, f"content_{base_name}")
             
-            with open(log_path, "w", encoding="utf-8") as f:
-                f.write(content)
+            if isinstance(content, bytes):
+                with open(log_path, "wb") as f:
+                    f.write(content)
+            else:
+                with open(log_path, "w", encoding="utf-8") as f:
+                    f.write(content)
             
             self.log(f"ファイル内容を {log_path} に保存しました", also_print=False)
     
@@ -78,6 +631,137 @@ class DebugLogger:
 # グローバル変数としてロガーを初期化
 debug_logger = DebugLogger(enabled=False)
 
+class MetricsCollector:
+    """実行ごとの運用メトリクスを集計し、Prometheus テキスト形式のファイルに累積して書き出すクラス
+    
+    カウンターとヒストグラムは既存のファイルの値に加算し、ゲージは上書きする。
+    ファイルは一時ファイルからの置き換えで更新するため、node-exporter の textfile コレクターなどが
+    書き込み途中の内容を読むことはない。
+    """
+    
+    # メトリクス名 → (種類, 説明)
+    DEFINITIONS = {
+        "procedure_parser_runs_total": ("counter", "実行回数"),
+        "procedure_parser_procedures_total": ("counter", "適用した手順書の数"),
+        "procedure_parser_operations_total": ("counter", "ファイル操作の数"),
+        "procedure_parser_operation_failures_total": ("counter", "失敗したファイル操作の数"),
+        "procedure_parser_bytes_written_total": ("counter", "書き込んだファイルのバイト数"),
+        "procedure_parser_skipped_modifications_total": ("counter", "マーカーやコンテキストが見つからずスキップした修正の数"),
+        "procedure_parser_git_failures_total": ("counter", "失敗したGit操作の数"),
+        "procedure_parser_stage_duration_seconds": ("histogram", "ステージごとの処理時間（秒）"),
+        "procedure_parser_action_duration_seconds": ("histogram", "ファイル操作ごとの処理時間（秒）"),
+        "procedure_parser_last_run_timestamp_seconds": ("gauge", "最後に実行した時刻（UNIX時間）"),
+    }
+    BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+    SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)')
+    
+    def __init__(self):
+        self.samples = {}  # {('名前', 'ラベル'): 値}
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+    
+    def inc(self, name, labels=None, value=1):
+        """カウンターを加算する"""
+        sample_key = (name, self._format_labels(labels))
+        with self.lock:
+            self.samples[sample_key] = self.samples.get(sample_key, 0) + value
+    
+    def set(self, name, value, labels=None):
+        """ゲージを設定する"""
+        with self.lock:
+            self.samples[(name, self._format_labels(labels))] = value
+    
+    def observe(self, name, seconds, labels=None):
+        """ヒストグラムに観測値を追加する"""
+        labels = labels or {}
+        for bound in self.BUCKETS:
+            if seconds <= bound:
+                self.inc(f"{name}_bucket", dict(labels, le=str(bound)))
+        self.inc(f"{name}_bucket", dict(labels, le="+Inf"))
+        self.inc(f"{name}_sum", labels, seconds)
+        self.inc(f"{name}_count", labels)
+    
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """with ブロックの処理時間をヒストグラムに記録する"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, labels)
+    
+    def _family(self, name):
+        """サンプル名からメトリクス名（ヒストグラムの _bucket などを除いた名前）を求める"""
+        for suffix in ("_bucket", "_sum", "_count"):
+            base = name[:-len(suffix)]
+            if name.endswith(suffix) and self.DEFINITIONS.get(base, ("",))[0] == "histogram":
+                return base
+        return name
+    
+    @staticmethod
+    def _sort_key(sample_key):
+        """ヒストグラムのバケットが le の数値順に並ぶようにする"""
+        name, labels = sample_key
+        le_match = re.search(r'le="([^"]+)"', labels)
+        return (name, re.sub(r',?le="[^"]+"', '', labels), float(le_match.group(1)) if le_match else 0.0)
+    
+    def _read(self, path):
+        samples = {}
+        if not os.path.exists(path):
+            return samples
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                match = self.SAMPLE_PATTERN.match(line)
+                if match and not line.startswith('#'):
+                    samples[(match.group(1), match.group(2) or "")] = float(match.group(3))
+        return samples
+    
+    def _render(self, samples):
+        lines = []
+        families = {}
+        for sample_key in sorted(samples, key=self._sort_key):
+            families.setdefault(self._family(sample_key[0]), []).append(sample_key)
+        for family, sample_keys in families.items():
+            metric_type, help_text = self.DEFINITIONS.get(family, ("untyped", ""))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            for name, labels in sample_keys:
+                value = samples[(name, labels)]
+                lines.append(f"{name}{labels} {int(value) if float(value).is_integer() else repr(value)}")
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path, status):
+        """今回の実行のメトリクスをファイルに累積して書き出す"""
+        self.inc("procedure_parser_runs_total", {"status": status})
+        self.set("procedure_parser_last_run_timestamp_seconds", int(time.time()))
+        
+        metrics_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(path + ".lock", 'w') as lock_file:
+            # 複数のプロセスが同時に更新しても加算が失われないよう排他する
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            samples = self._read(path)
+            with self.lock:
+                for (name, labels), value in self.samples.items():
+                    if self.DEFINITIONS.get(self._family(name), ("",))[0] == "gauge":
+                        samples[(name, labels)] = value
+                    else:
+                        samples[(name, labels)] = samples.get((name, labels), 0) + value
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self._render(samples))
+            os.replace(tmp_path, path)
+        debug_logger.log(f"メトリクスを書き出しました: {path}")
+
+# グローバル変数としてメトリクスを初期化
+metrics = MetricsCollector()
+
 class ProcedureValidator:
     """手順書のフォーマット検証クラス"""
     
@@ -89,24 +773,13 @@ class ProcedureValidator:
         """手順書のフォーマットを検証する"""
         debug_logger.log("手順書の検証を開始")
         
-        # バージョン確認
-        if not self._check_version():
-            self.errors.append("準拠手順書形式のバージョン情報が見つからないか、フォーマットが不正です")
+        self._validate_header()
         
-        # 必須セクションの確認
-        required_sections = ["## 概要", "## アプリ実行コマンド", "## 必要ファイル一覧", "## ファイルの中身", "## 備考"]
-        for section in required_sections:
+        # 備考セクションの確認（ヘッダー部分以外の必須セクション）
+        for section in ["## ファイルの中身", "## 備考"]:
             if section not in self.content:
                 self.errors.append(f"必須セクション「{section}」が見つかりません")
         
-        # ファイル一覧のフォーマットチェック
-        file_list_match = re.search(r'## 必要ファイル一覧\n(.*?)(?=##)', self.content, re.DOTALL)
-        if file_list_match:
-            file_list = file_list_match.group(1).strip().split('\n')
-            for line in file_list:
-                if line.strip() and not re.match(r'^(新規|修正|削除),\d{5},\S+', line.strip()):
-                    self.errors.append(f"ファイル一覧のフォーマットが不正です: {line}")
-        
         # ファイル内容セクションのフォーマットチェック
         file_sections = re.finditer(r'### (新規|修正|削除),(\d{5}),([^\n]+)\n(コミット内容：([^\n]+)\n)?', self.content, re.DOTALL)
         file_ids = set()
@@ -128,51 +801,169 @@ class ProcedureValidator:
                 file_content_match = re.search(file_end_pattern, self.content[match.start():], re.DOTALL)
                 
                 if file_content_match:
-                    file_content = file_content_match.group(2)
-                    
-                    if action == "新規":
-                        # 新規ファイルの場合
-                        # v2.1.0形式のコード管理番号パターン
-                        code_numbers = re.findall(r'(?://|#|<!--|/\*)?\s*#(\d{5}_[a-z]{5})', file_content)
-                        
-                        if not code_numbers:
-                            self.errors.append(f"ファイルID {file_id} のコード管理番号が見つかりません")
-                        
-                        # 終点マーカーの確認
-                        if '99999_zzzzz' not in ''.join(code_numbers):
-                            self.errors.append(f"ファイルID {file_id} に終点マーカー #99999_zzzzz が見つかりません")
-                        
-                        # 連番かつ一意のチェック
-                        unique_numbers = set(code_numbers)
-                        if len(code_numbers) != len(unique_numbers):
-                            self.errors.append(f"ファイルID {file_id} のコード管理番号に重複があります")
-                    
-                    elif action == "修正":
-                        # 修正区間のチェック
-                        # v2.1.0形式のコード管理番号パターン
-                        modification_sections = re.finditer(r'####\s+#(\d{5}_[a-z]{5})-#(\d{5}_[a-z]{5})\s*\n```[a-z]*\n([\s\S]*?)```', file_content, re.DOTALL)
-                        for mod_match in modification_sections:
-                            start_code = mod_match.group(1)
-                            end_code = mod_match.group(2)
-                            mod_content = mod_match.group(3)
-                            
-                            debug_logger.log(f"修正区間検出: #{start_code}-#{end_code}")
-                            
-                            # 修正区間内にコード管理番号があるかチェック
-                            section_code_numbers = re.findall(r'(?://|#|<!--|/\*)?\s*#(\d{5}_[a-z]{5})', mod_content)
-                            
-                            if not section_code_numbers:
-                                self.errors.append(f"ファイルID {file_id} の修正区間 #{start_code}-#{end_code} にコード管理番号が見つかりません")
-                            
-                            # 修正区間の開始と終了コードが含まれているかチェック
-                            if start_code not in section_code_numbers:
-                                self.errors.append(f"ファイルID {file_id} の修正区間 #{start_code}-#{end_code} に開始コード #{start_code} が含まれていません")
-                            if end_code not in section_code_numbers:
-                                self.errors.append(f"ファイルID {file_id} の修正区間 #{start_code}-#{end_code} に終了コード #{end_code} が含まれていません")
+                    if action == "新規" and re.search(BINARY_BLOCK_PATTERN, file_content_match.group(2)):
+                        self._validate_binary(file_id, file_content_match.group(2))
+                    else:
+                        self._validate_code_numbers(action, file_id, file_content_match.group(2))
+            
+            # 修正の場合は差分形式のハンクの構文をチェック
+            if action == "修正" and not is_excluded_file(file_path):
+                next_section = re.search(r'\n### (新規|修正|削除),\d{5},|\n## 備考', self.content[match.start() + 1:])
+                section_end = match.start() + 1 + next_section.start() if next_section else len(self.content)
+                self._validate_diff_sections(file_id, self.content[match.start():section_end])
         
         debug_logger.log(f"手順書検証完了。エラー数: {len(self.errors)}")
         return len(self.errors) == 0
     
+    def validate_header(self):
+        """「## ファイルの中身」より前の部分（バージョン・概要・実行コマンド・ファイル一覧）のみを検証する"""
+        debug_logger.log("手順書ヘッダーの検証を開始")
+        self._validate_header()
+        debug_logger.log(f"手順書ヘッダー検証完了。エラー数: {len(self.errors)}")
+        return len(self.errors) == 0
+    
+    def validate_sections(self, selected):
+        """ファイルの中身を検証する（絞り込み時用。validate_header の後に呼び出す）
+        
+        selected(file_id, file_path) が True のセクションのみ内容（コードブロック・修正区間・バイナリ）を検証し、
+        それ以外は見出しとファイルIDの重複のみを確認する
+        """
+        debug_logger.log("ファイルセクションの検証を開始（絞り込み）")
+        for section in ["## ファイルの中身", "## 備考"]:
+            if section not in self.content:
+                self.errors.append(f"必須セクション「{section}」が見つかりません")
+        
+        headers = list(re.finditer(r'^### (新規|修正|削除),(\d{5}),([^\n]+)$', self.content, re.MULTILINE))
+        notes_match = re.search(r'^## 備考', self.content, re.MULTILINE)
+        file_ids = set()
+        for i, match in enumerate(headers):
+            action, file_id, file_path = match.groups()
+            if file_id in file_ids:
+                self.errors.append(f"ファイルID {file_id} が重複しています")
+            file_ids.add(file_id)
+            if not selected(file_id, file_path):
+                continue
+            
+            section_end = headers[i + 1].start() if i + 1 < len(headers) else len(self.content)
+            if notes_match and match.start() < notes_match.start() < section_end:
+                section_end = notes_match.start()
+            self.validate_section(action, file_id, file_path, self.content[match.start():section_end])
+        
+        debug_logger.log(f"ファイルセクション検証完了。エラー数: {len(self.errors)}")
+        return len(self.errors) == 0
+    
+    def validate_section(self, action, file_id, file_path, section_content):
+        """1つのファイルセクション（またはその中の1つの修正区間）を検証する"""
+        if action in ["新規", "修正"] and not is_excluded_file(file_path):
+            if action == "新規" and re.search(BINARY_BLOCK_PATTERN, section_content):
+                self._validate_binary(file_id, section_content)
+            else:
+                self._validate_code_numbers(action, file_id, section_content)
+            if action == "修正":
+                self._validate_diff_sections(file_id, section_content)
+        return len(self.errors) == 0
+    
+    def _validate_header(self):
+        # バージョン確認
+        if not self._check_version():
+            self.errors.append("準拠手順書形式のバージョン情報が見つからないか、フォーマットが不正です")
+        
+        # 必須セクションの確認
+        required_sections = ["## 概要", "## アプリ実行コマンド", "## 必要ファイル一覧"]
+        for section in required_sections:
+            if section not in self.content:
+                self.errors.append(f"必須セクション「{section}」が見つかりません")
+        
+        # ファイル一覧のフォーマットチェック
+        file_list_match = re.search(r'## 必要ファイル一覧\n(.*?)(?=##)', self.content, re.DOTALL)
+        if file_list_match:
+            file_list = file_list_match.group(1).strip().split('\n')
+            for line in file_list:
+                if line.strip() and not re.match(r'^(新規|修正|削除),\d{5},\S+', line.strip()):
+                    self.errors.append(f"ファイル一覧のフォーマットが不正です: {line}")
+    
+    def _validate_code_numbers(self, action, file_id, file_content):
+        """新規ファイルのコード管理番号と、修正区間の開始・終了コードをチェック"""
+        if action == "新規":
+            # 新規ファイルの場合
+            # v2.1.0形式のコード管理番号パターン
+            code_numbers = re.findall(r'(?://|#|<!--|/\*)?\s*#(\d{5}_[a-z]{5})', file_content)
+            
+            if not code_numbers:
+                self.errors.append(f"ファイルID {file_id} のコード管理番号が見つかりません")
+            
+            # 終点マーカーの確認
+            if '99999_zzzzz' not in ''.join(code_numbers):
+                self.errors.append(f"ファイルID {file_id} に終点マーカー #99999_zzzzz が見つかりません")
+            
+            # 連番かつ一意のチェック
+            unique_numbers = set(code_numbers)
+            if len(code_numbers) != len(unique_numbers):
+                self.errors.append(f"ファイルID {file_id} のコード管理番号に重複があります")
+        
+        elif action == "修正":
+            # 修正区間のチェック
+            # v2.1.0形式のコード管理番号パターン
+            modification_sections = re.finditer(r'####\s+#(\d{5}_[a-z]{5})-#(\d{5}_[a-z]{5})\s*\n```[a-z]*\n([\s\S]*?)```', file_content, re.DOTALL)
+            for mod_match in modification_sections:
+                start_code = mod_match.group(1)
+                end_code = mod_match.group(2)
+                mod_content = mod_match.group(3)
+                
+                debug_logger.log(f"修正区間検出: #{start_code}-#{end_code}")
+                
+                # 修正区間内にコード管理番号があるかチェック
+                section_code_numbers = re.findall(r'(?://|#|<!--|/\*)?\s*#(\d{5}_[a-z]{5})', mod_content)
+                
+                if not section_code_numbers:
+                    self.errors.append(f"ファイルID {file_id} の修正区間 #{start_code}-#{end_code} にコード管理番号が見つかりません")
+                
+                # 修正区間の開始と終了コードが含まれているかチェック
+                if start_code not in section_code_numbers:
+                    self.errors.append(f"ファイルID {file_id} の修正区間 #{start_code}-#{end_code} に開始コード #{start_code} が含まれていません")
+                if end_code not in section_code_numbers:
+                    self.errors.append(f"ファイルID {file_id} の修正区間 #{start_code}-#{end_code} に終了コード #{end_code} が含まれていません")
+    
+    def _validate_binary(self, file_id, section_content):
+        """バイナリファイル（base64）の宣言されたサイズとハッシュをチェック"""
+        block_match = re.search(BINARY_BLOCK_PATTERN, section_content)
+        info_match = re.search(BINARY_INFO_PATTERN, section_content)
+        if not info_match:
+            self.errors.append(f"ファイルID {file_id} のバイナリ情報（バイナリ情報：size=バイト数,sha256=ハッシュ値）が見つかりません")
+            return
+        
+        declared_size = int(info_match.group(1))
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            for data in iter_binary_payload(section_content, block_match.start(2), block_match.end(2),
+                                            block_match.group(1), max_size=declared_size):
+                digest.update(data)
+                size += len(data)
+        except (ValueError, binascii.Error, zlib.error) as e:
+            self.errors.append(f"ファイルID {file_id} のバイナリデータをデコードできません: {e}")
+            return
+        
+        if size != declared_size:
+            self.errors.append(f"ファイルID {file_id} のバイナリデータのサイズが一致しません（宣言: {declared_size} バイト、実際: {size} バイト）")
+        elif digest.hexdigest() != info_match.group(2).lower():
+            self.errors.append(f"ファイルID {file_id} のバイナリデータの sha256 が一致しません")
+    
+    def _validate_diff_sections(self, file_id, section_content):
+        """修正セクション内の差分形式（#### 差分）のハンクの構文をチェック"""
+        # 見出しの形式チェック
+        for heading in re.finditer(r'^####\s+差分[^\n]*', section_content, re.MULTILINE):
+            if not re.match(r'####\s+差分\s+#\d{5}_[a-z]{5}\s*$', heading.group(0)):
+                self.errors.append(f"ファイルID {file_id} の差分見出しの形式が不正です: {heading.group(0)}")
+        
+        for diff_match in re.finditer(DIFF_SECTION_PATTERN, section_content):
+            anchor = diff_match.group(1)
+            debug_logger.log(f"差分検出: ファイルID {file_id} アンカー #{anchor}")
+            try:
+                parse_diff_hunks(diff_match.group(2))
+            except ValueError as e:
+                self.errors.append(f"ファイルID {file_id} の差分 #{anchor} の形式が不正です: {e}")
+    
     def _check_version(self):
         """バージョン情報をチェック"""
         version_match = re.search(r'準拠手順書形式：v(\d+\.\d+\.\d+)', self.content)
@@ -194,15 +985,26 @@ class ProcedureParser:
     def __init__(self, procedure_file_path):
         self.procedure_file_path = procedure_file_path
         self.procedure_content = None
+        self.procedure_hash = None
         self.app_name = None
         self.version = None
         self.overview = None
         self.run_commands = []
         self.file_list = []  # [{'type': 'new', 'id': '00001', 'path': 'file.txt'}]
         self.file_contents = {}
+        self.content_spans = {}  # {'file_id,path': (開始位置, 終了位置)} 手順書内での新規ファイルの内容の位置
+        self.binary_contents = {}  # {'file_id,path': {'encoding': 'base64', 'size': 123, 'sha256': '...', 'span': (開始位置, 終了位置), 'source': 手順書の内容}}
         self.file_modifications = {}  # {'file_id': [{'start': '00001', 'end': '00002', 'content': '...'}]}
         self.commit_messages = {}
         self.notes = None
+        self.interactive = True  # False の場合は確認プロンプトを表示せずに中止する
+        self.git_error = None
+        self.commit_failed = False  # Git操作またはコミットに失敗した場合は True（メトリクスの status に反映する）
+        self.touched_files = []  # [{'id': '00001', 'path': 'file.txt', 'full_path': 'out/file.txt'}]
+        self._snapshots = {}  # {'out/file.txt': b'変更前の内容' または None}
+        self._created_dirs = []  # 適用中に作成したディレクトリ（親から順。ロールバック時に空なら削除する）
+        self.entry_filter = None  # EntryFilter を指定した場合は一致するエントリのみ適用する
+        self.filtered_out = []  # 絞り込みで除外したファイル一覧のエントリ
         
     def parse(self):
         """手順書の内容を解析する"""
@@ -212,23 +1014,46 @@ class ProcedureParser:
                 debug_logger.log(f"手順書 {self.procedure_file_path} を読み込みました ({len(self.procedure_content)} バイト)")
                 # 手順書全体をログに保存
                 debug_logger.log_file_content("procedure_full_content.md", self.procedure_content)
+            self.procedure_hash = hashlib.sha256(self.procedure_content.encode('utf-8')).hexdigest()
         except Exception as e:
             debug_logger.log(f"エラー: 手順書の読み込みに失敗しました: {e}")
             print_info(f"エラー: 手順書の読み込みに失敗しました: {e}")
             sys.exit(1)
         
-        # バリデーション
+        # バリデーション（絞り込み時はヘッダーのみ先に検証し、絞り込んだセクションの内容のみ後で検証する）
         validator = ProcedureValidator(self.procedure_content)
-        if not validator.validate():
-            debug_logger.log("手順書のフォーマットが不正です:")
-            print_info("エラー: 手順書のフォーマットが不正です:")
-            for error in validator.get_errors():
-                debug_logger.log(f"- {error}")
-                print_info(f"- {error}")
-            sys.exit(1)
+        if not (validator.validate_header() if self.entry_filter else validator.validate()):
+            self._exit_with_errors(validator)
         
         # バージョンの取得と照合
-        self.version = validator.get_version()
+        self._check_version_compatibility(validator.get_version())
+        
+        self._parse_header()
+        self._filter_file_list()
+        if self.entry_filter and not validator.validate_sections(self._is_selected):
+            self._exit_with_errors(validator)
+        self._parse_file_sections()
+        
+        # 備考の取得
+        notes_match = re.search(r'## 備考\n(.*?)(?=$)', self.procedure_content, re.DOTALL)
+        if notes_match:
+            self.notes = notes_match.group(1).strip()
+            debug_logger.log(f"備考を取得しました ({len(self.notes)} 文字)")
+        
+        return self
+    
+    def _exit_with_errors(self, validator):
+        """検証エラーを表示して終了する"""
+        debug_logger.log("手順書のフォーマットが不正です:")
+        print_info("エラー: 手順書のフォーマットが不正です:")
+        for error in validator.get_errors():
+            debug_logger.log(f"- {error}")
+            print_info(f"- {error}")
+        sys.exit(1)
+    
+    def _check_version_compatibility(self, version):
+        """スクリプトと手順書の準拠形式バージョンを照合する"""
+        self.version = version
         version_without_v = self.version[1:] if self.version and self.version.startswith('v') else ""
 
         # バージョン比較のロジックを修正（メジャー.マイナーまでの一致を確認）
@@ -243,11 +1068,18 @@ class ProcedureParser:
 
         if not version_match:
             debug_logger.log(f"警告: スクリプトのバージョン({VERSION})と手順書の準拠形式バージョン({version_without_v})が一致しません")
-            print_info(f"★警告: スクリプトのバージョン({VERSION})と手順書の準拠形式バージョン({version_without_v})が一致しません")
-            response = input("続行しますか？ (y/n): ")
+            warning = f"★警告: スクリプトのバージョン({VERSION})と手順書の準拠形式バージョン({version_without_v})が一致しません"
+            if not self.interactive:
+                with prompt_lock:
+                    print_info(warning)
+                    print_info("エラー: 確認できないため処理を中止します")
+                sys.exit(1)
+            response = ask_user("続行しますか？ (y/n): ", notice=[warning])
             if response.lower() != 'y':
                 sys.exit(0)
-        
+    
+    def _parse_header(self):
+        """タイトル・概要・実行コマンド・必要ファイル一覧を取得する"""
         # タイトルの取得
         title_match = re.search(r'# ([^\n]+)', self.procedure_content)
         if title_match:
@@ -290,7 +1122,28 @@ class ProcedureParser:
                     })
                     debug_logger.log(f"ファイル一覧に追加: {action_type}({action}), {file_id}, {file_path}")
         
-        # ファイルの中身とコミットメッセージの取得
+    def _filter_file_list(self):
+        """ファイル一覧を --only / --exclude で絞り込む（ファイルの中身を抽出する前に行う）"""
+        if not self.entry_filter:
+            return
+        selected = []
+        for file_entry in self.file_list:
+            if self.entry_filter.matches(file_entry["id"], file_entry["path"]):
+                selected.append(file_entry)
+            else:
+                self.filtered_out.append(file_entry)
+                debug_logger.log(f"絞り込みにより除外: {file_entry['id']}, {file_entry['path']}")
+        self.file_list = selected
+        print_info(f"絞り込み（{self.entry_filter.describe()}）: {len(selected)} 件を適用、{len(self.filtered_out)} 件を除外します")
+    
+    def _is_selected(self, file_id, file_path):
+        """絞り込みを指定した場合に、セクションが適用対象のエントリかどうかを判定する"""
+        if not self.entry_filter:
+            return True
+        return any(entry["id"] == file_id and entry["path"] == file_path.strip() for entry in self.file_list)
+    
+    def _parse_file_sections(self):
+        """ファイルの中身とコミットメッセージを取得する"""
         file_section_pattern = r'### (新規|修正|削除),(\d{5}),([^\n]+)(?:\nコミット内容：([^\n]+))?'
         file_sections = re.finditer(file_section_pattern, self.procedure_content)
         
@@ -300,6 +1153,11 @@ class ProcedureParser:
             file_path = match.group(3)
             commit_msg = match.group(4) if match.group(4) else f"{action} {file_path}"
             
+            if not self._is_selected(file_id, file_path):
+                # 絞り込みで除外したエントリのコードブロック・修正区間は抽出しない
+                debug_logger.log(f"ファイルセクションをスキップ（絞り込み）: {action}, {file_id}, {file_path}")
+                continue
+            
             debug_logger.log(f"ファイルセクション処理: {action}, {file_id}, {file_path}")
             debug_logger.log(f"コミットメッセージ: {commit_msg}")
             
@@ -323,77 +1181,156 @@ class ProcedureParser:
             section_content = self.procedure_content[section_start:section_end].strip()
             debug_logger.log(f"セクション内容の長さ: {len(section_content)}")
             
-            key = f"{file_id},{file_path}"
+            self._parse_file_section(action, file_id, file_path, commit_msg, section_content, section_start)
+    
+    def _parse_file_section(self, action, file_id, file_path, commit_msg, section_content, section_offset=None):
+        """1つのファイルセクションから新規ファイルの内容または修正区間を抽出する
+        
+        section_offset（手順書内でのセクションの開始位置）を指定した場合は、内容の位置も記録する
+        """
+        key = f"{file_id},{file_path}"
+        
+        def span(match, group):
+            if section_offset is None:
+                return None
+            return (section_offset + match.start(group), section_offset + match.end(group))
+        
+        binary_match = re.search(BINARY_BLOCK_PATTERN, section_content) if action == "新規" else None
+        if binary_match:
+            # バイナリファイルの場合、デコードせずにペイロードの位置だけを記録する
+            info_match = re.search(BINARY_INFO_PATTERN, section_content)
+            if section_offset is None:
+                source, payload_span = section_content, (binary_match.start(2), binary_match.end(2))
+            else:
+                source, payload_span = self.procedure_content, span(binary_match, 2)
+            self.binary_contents[key] = {
+                "encoding": binary_match.group(1),
+                "size": int(info_match.group(1)) if info_match else None,
+                "sha256": info_match.group(2).lower() if info_match else None,
+                "span": payload_span,
+                "source": source
+            }
+            debug_logger.log(f"バイナリファイル {file_path} を検出しました ({binary_match.group(1)}, {self.binary_contents[key]['size']} バイト)")
+        
+        elif action == "新規":
+            # 新規ファイルの場合、コードブロックの内容を抽出
+            code_block_match = re.search(r'```[a-z]*\n(.*?)```', section_content, re.DOTALL)
+            if code_block_match:
+                self.file_contents[key] = code_block_match.group(1)
+                self.content_spans[key] = span(code_block_match, 1)
+                debug_logger.log(f"新規ファイル {file_path} の内容を抽出しました ({len(self.file_contents[key])} バイト)")
+        
+        elif action == "修正":
+            # 修正ファイルの場合、修正区間を抽出
+            self.file_modifications[key] = []
             
-            if action == "新規":
-                # 新規ファイルの場合、コードブロックの内容を抽出
-                code_block_match = re.search(r'```[a-z]*\n(.*?)```', section_content, re.DOTALL)
-                if code_block_match:
-                    self.file_contents[key] = code_block_match.group(1)
-                    debug_logger.log(f"新規ファイル {file_path} の内容を抽出しました ({len(self.file_contents[key])} バイト)")
+            # デバッグ出力
+            debug_logger.log(f"修正ファイル {file_path} の処理を開始")
+            print_info(f"修正ファイル {file_path} の処理を開始")
             
-            elif action == "修正":
-                # 修正ファイルの場合、修正区間を抽出
-                self.file_modifications[key] = []
+            # 修正区間を検索
+            modification_pattern = r'####\s+#(\d+(?:_[a-zA-Z0-9]+)?)-#(\d+(?:_[a-zA-Z0-9]+)?)\s*\n```[a-z]*\n([\s\S]*?)```'
+            modification_sections = list(re.finditer(modification_pattern, section_content, re.DOTALL))
+
+            debug_logger.log(f"修正区間検索パターン: {modification_pattern}")
+            debug_logger.log(f"修正区間数: {len(modification_sections)}")
+
+            # セクションの内容をデバッグログに出力
+            debug_logger.log_file_content(f"{file_id}_{file_path}_section_content.txt", section_content)
+
+            # 差分形式の修正セクションを検索
+            diff_sections = list(re.finditer(DIFF_SECTION_PATTERN, section_content))
+            debug_logger.log(f"差分セクション数: {len(diff_sections)}")
+            
+            if len(modification_sections) == 0 and len(diff_sections) == 0:
+                debug_logger.log("修正区間が見つかりません。代替パターンを試します。")
+                alt_pattern = r'####.*?#(\d+(?:_[a-zA-Z0-9]+)?)-#(\d+(?:_[a-zA-Z0-9]+)?).*?\n```.*?\n([\s\S]*?)```'
+                debug_logger.log(f"代替パターン: {alt_pattern}")
+                modification_sections = list(re.finditer(alt_pattern, section_content, re.DOTALL))
+                debug_logger.log(f"代替パターンによる修正区間数: {len(modification_sections)}")
+            
+            for mod_match in modification_sections:
+                start_code = mod_match.group(1)
+                end_code = mod_match.group(2)
+                mod_content = mod_match.group(3)
                 
-                # デバッグ出力
-                debug_logger.log(f"修正ファイル {file_path} の処理を開始")
-                print_info(f"修正ファイル {file_path} の処理を開始")
+                # 修正内容をデバッグ出力
+                debug_logger.log(f"修正区間 #{start_code}-#{end_code} を抽出しました")
+                debug_logger.log_file_content(f"{file_id}_{file_path}_mod_{start_code}_{end_code}.txt", mod_content)
                 
-                # 修正区間を検索
-                modification_pattern = r'####\s+#(\d+(?:_[a-zA-Z0-9]+)?)-#(\d+(?:_[a-zA-Z0-9]+)?)\s*\n```[a-z]*\n([\s\S]*?)```'
-                modification_sections = list(re.finditer(modification_pattern, section_content, re.DOTALL))
-
-                debug_logger.log(f"修正区間検索パターン: {modification_pattern}")
-                debug_logger.log(f"修正区間数: {len(modification_sections)}")
-
-                # セクションの内容をデバッグログに出力
-                debug_logger.log_file_content(f"{file_id}_{file_path}_section_content.txt", section_content)
-
-                if len(modification_sections) == 0:
-                    debug_logger.log("修正区間が見つかりません。代替パターンを試します。")
-                    alt_pattern = r'####.*?#(\d+(?:_[a-zA-Z0-9]+)?)-#(\d+(?:_[a-zA-Z0-9]+)?).*?\n```.*?\n([\s\S]*?)```'
-                    debug_logger.log(f"代替パターン: {alt_pattern}")
-                    modification_sections = list(re.finditer(alt_pattern, section_content, re.DOTALL))
-                    debug_logger.log(f"代替パターンによる修正区間数: {len(modification_sections)}")
+                preview = mod_content[:50] + ("..." if len(mod_content) > 50 else "")
+                debug_logger.log(f"修正内容の先頭部分: {preview}")
+                print_info(f"修正区間 #{start_code}-#{end_code} を抽出しました")
+                print_info(f"修正内容の先頭部分: {preview}")
                 
-                for mod_match in modification_sections:
-                    start_code = mod_match.group(1)
-                    end_code = mod_match.group(2)
-                    mod_content = mod_match.group(3)
-                    
-                    # 修正内容をデバッグ出力
-                    debug_logger.log(f"修正区間 #{start_code}-#{end_code} を抽出しました")
-                    debug_logger.log_file_content(f"{file_id}_{file_path}_mod_{start_code}_{end_code}.txt", mod_content)
-                    
-                    preview = mod_content[:50] + ("..." if len(mod_content) > 50 else "")
-                    debug_logger.log(f"修正内容の先頭部分: {preview}")
-                    print_info(f"修正区間 #{start_code}-#{end_code} を抽出しました")
-                    print_info(f"修正内容の先頭部分: {preview}")
-                    
-                    self.file_modifications[key].append({
-                        "start": start_code,
-                        "end": end_code,
-                        "content": mod_content
-                    })
+                self.file_modifications[key].append({
+                    "type": "range",
+                    "start": start_code,
+                    "end": end_code,
+                    "content": mod_content,
+                    "span": span(mod_match, 3)
+                })
+            
+            for diff_match in diff_sections:
+                anchor = diff_match.group(1)
+                diff_content = diff_match.group(2)
+                hunks = parse_diff_hunks(diff_content)
+                debug_logger.log(f"差分 #{anchor} を抽出しました ({len(hunks)} ハンク)")
+                debug_logger.log_file_content(f"{file_id}_{file_path}_diff_{anchor}.txt", diff_content)
+                print_info(f"差分 #{anchor} を抽出しました（{len(hunks)} ハンク）")
                 
-                if len(self.file_modifications[key]) == 0:
-                    debug_logger.log(f"警告: ファイル {file_path} に修正区間が見つかりませんでした")
-                    print_info(f"★警告: ファイル {file_path} に修正区間が見つかりませんでした")
+                self.file_modifications[key].append({
+                    "type": "diff",
+                    "anchor": anchor,
+                    "hunks": hunks,
+                    "content": diff_content,
+                    "span": span(diff_match, 2)
+                })
             
-            # コミットメッセージを保存
-            self.commit_messages[key] = commit_msg
-        
-        # 備考の取得
-        notes_match = re.search(r'## 備考\n(.*?)(?=$)', self.procedure_content, re.DOTALL)
-        if notes_match:
-            self.notes = notes_match.group(1).strip()
-            debug_logger.log(f"備考を取得しました ({len(self.notes)} 文字)")
+            if len(self.file_modifications[key]) == 0:
+                debug_logger.log(f"警告: ファイル {file_path} に修正区間が見つかりませんでした")
+                print_info(f"★警告: ファイル {file_path} に修正区間が見つかりませんでした")
         
-        return self
+        # コミットメッセージを保存
+        self.commit_messages[key] = commit_msg
+    
+    @classmethod
+    def from_plan(cls, plan, procedure_content, procedure_file_path, entry_filter=None):
+        """適用計画と元の手順書の内容から解析済みの状態を復元する（Markdownの解析は行わない）"""
+        procedure_parser = cls(procedure_file_path)
+        procedure_parser.entry_filter = entry_filter
+        procedure_parser.procedure_content = procedure_content
+        procedure_parser.procedure_hash = plan["source_sha256"]
+        procedure_parser.app_name = plan["app_name"]
+        procedure_parser.version = plan["version"]
+        procedure_parser.run_commands = plan["run_commands"]
+        procedure_parser.file_list = plan["file_list"]
+        procedure_parser.commit_messages = plan["commit_messages"]
+        procedure_parser._filter_file_list()
+        selected = {f"{entry['id']},{entry['path']}" for entry in procedure_parser.file_list}
+        for key, (start, end) in plan["contents"].items():
+            if entry_filter and key not in selected:
+                continue
+            procedure_parser.file_contents[key] = procedure_content[start:end]
+            procedure_parser.content_spans[key] = (start, end)
+        for key, binary in plan["binaries"].items():
+            if entry_filter and key not in selected:
+                continue
+            procedure_parser.binary_contents[key] = dict(binary, span=tuple(binary["span"]), source=procedure_content)
+        for key, modifications in plan["modifications"].items():
+            if entry_filter and key not in selected:
+                continue
+            procedure_parser.file_modifications[key] = [
+                dict(mod, content=procedure_content[mod["span"][0]:mod["span"][1]]) for mod in modifications
+            ]
+        debug_logger.log(f"適用計画から復元しました: {procedure_file_path} ({len(procedure_parser.file_list)} ファイル)")
+        return procedure_parser
     
-    def create_project_structure(self, base_dir):
-        """解析した手順書に基づいてプロジェクト構造を作成する"""
+    def create_project_structure(self, base_dir, checkpoint=None):
+        """解析した手順書に基づいてプロジェクト構造を作成する
+        
+        checkpoint を指定した場合は操作ごとに完了を記録し、記録済みの操作はスキップする
+        """
         debug_logger.log(f"プロジェクト構造の作成を開始: {base_dir}")
         
         # 除外ファイル拡張子のリストを表示
@@ -401,92 +1338,194 @@ class ProcedureParser:
         print_info("これらのファイルは手動で作成または修正してください。")
         
         if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
-            debug_logger.log(f"ディレクトリ作成: {base_dir}")
-            print_info(f"ディレクトリ作成: {base_dir}")
+            self._make_dirs(base_dir)
         
         # ファイル操作
         for file_entry in self.file_list:
-            try:
-                action = file_entry["type"]
-                file_id = file_entry["id"]
-                file_path = file_entry["path"]
-                full_path = os.path.join(base_dir, file_path)
-                dir_path = os.path.dirname(full_path)
-                
-                debug_logger.log(f"ファイル処理: {action}, {file_id}, {file_path}")
-                
-                # 除外ファイルチェック
-                if is_excluded_file(file_path):
-                    print_info(f"★注意: {file_path} は除外リストに含まれるため、自動処理されません。手動で{action}してください。")
-                    debug_logger.log(f"除外ファイル: {file_path}は処理がスキップされます")
-                    continue
-                
-                # ディレクトリがなければ作成
-                if dir_path and not os.path.exists(dir_path):
-                    os.makedirs(dir_path)
-                    debug_logger.log(f"ディレクトリ作成: {dir_path}")
-                    print_info(f"ディレクトリ作成: {dir_path}")
-                
-                key = f"{file_id},{file_path}"
-                
-                if action == "delete":
-                    # ファイル削除
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                        debug_logger.log(f"ファイル削除: {full_path}")
-                        print_info(f"ファイル削除: {full_path}")
-                    else:
-                        debug_logger.log(f"警告: 削除対象ファイル {full_path} が見つかりません")
-                        print_info(f"★警告: 削除対象ファイル {full_path} が見つかりません")
-                
-                elif action == "new":
-                    # 新規ファイル作成
-                    if key in self.file_contents:
-                        with open(full_path, 'w', encoding='utf-8') as f:
-                            f.write(self.file_contents[key])
-                        debug_logger.log(f"ファイル作成: {full_path}")
-                        print_info(f"ファイル作成: {full_path}")
-                    else:
-                        debug_logger.log(f"警告: ファイル {file_path} の内容が見つかりません")
-                        print_info(f"★警告: ファイル {file_path} の内容が見つかりません")
-                
-                elif action == "modify":
-                    # ファイル修正
-                    if key in self.file_modifications and os.path.exists(full_path):
-                        self._modify_file(full_path, self.file_modifications[key])
-                        debug_logger.log(f"ファイル更新: {full_path}")
-                        print_info(f"ファイル更新: {full_path}")
-                    else:
-                        debug_logger.log(f"警告: ファイル {file_path} の修正情報が見つからないか、ファイルが存在しません")
-                        print_info(f"★警告: ファイル {file_path} の修正情報が見つからないか、ファイルが存在しません")
-            
-            except Exception as e:
-                debug_logger.log(f"エラー: ファイル {file_path} の処理に失敗しました: {e}")
-                print_info(f"エラー: ファイル {file_path} の処理に失敗しました: {e}")
+            if checkpoint and checkpoint.is_completed(file_entry["id"]):
+                debug_logger.log(f"チェックポイント: ファイルID {file_entry['id']} は適用済みのためスキップします")
+                print_info(f"適用済みのためスキップ: {file_entry['path']}")
+                continue
+            if self._try_apply_file_entry(base_dir, file_entry) and checkpoint:
+                checkpoint.mark_completed(file_entry["id"])
         
         # 実行コマンドをbat/shファイルとして保存
-        if self.run_commands:
-            if os.name == 'nt':  # Windows
-                script_path = os.path.join(base_dir, "run.bat")
-                with open(script_path, 'w', encoding='utf-8') as f:
-                    f.write("@echo off\n")
-                    for cmd in self.run_commands:
-                        f.write(f"{cmd}\n")
-                debug_logger.log(f"実行スクリプト作成: {script_path}")
-                print_info(f"実行スクリプト作成: {script_path}")
-            else:  # Unix/Linux/Mac
-                script_path = os.path.join(base_dir, "run.sh")
-                with open(script_path, 'w', encoding='utf-8') as f:
-                    f.write("#!/bin/bash\n")
-                    for cmd in self.run_commands:
-                        f.write(f"{cmd}\n")
-                os.chmod(script_path, 0o755)  # 実行権限を付与
-                debug_logger.log(f"実行スクリプト作成: {script_path}")
-                print_info(f"実行スクリプト作成: {script_path}")
+        self._write_run_script(base_dir)
+    
+    def _try_apply_file_entry(self, base_dir, file_entry):
+        """ファイル操作を実行する。失敗した場合はエラーを表示して False を返す"""
+        metrics.inc("procedure_parser_operations_total", {"action": file_entry["type"]})
+        try:
+            with metrics.timer("procedure_parser_action_duration_seconds", action=file_entry["type"]):
+                self._apply_file_entry(base_dir, file_entry)
+            return True
+        except Exception as e:
+            metrics.inc("procedure_parser_operation_failures_total", {"action": file_entry["type"]})
+            debug_logger.log(f"エラー: ファイル {file_entry['path']} の処理に失敗しました: {e}")
+            print_info(f"エラー: ファイル {file_entry['path']} の処理に失敗しました: {e}")
+            return False
+    
+    def _apply_file_entry(self, base_dir, file_entry):
+        """ファイル一覧の1エントリ分の操作（新規・修正・削除）を実行する"""
+        action = file_entry["type"]
+        file_id = file_entry["id"]
+        file_path = file_entry["path"]
+        full_path = os.path.join(base_dir, file_path)
+        dir_path = os.path.dirname(full_path)
+        
+        debug_logger.log(f"ファイル処理: {action}, {file_id}, {file_path}")
+        
+        # 除外ファイルチェック
+        if is_excluded_file(file_path):
+            print_info(f"★注意: {file_path} は除外リストに含まれるため、自動処理されません。手動で{action}してください。")
+            debug_logger.log(f"除外ファイル: {file_path}は処理がスキップされます")
+            return
+        
+        # ディレクトリがなければ作成
+        if dir_path and not os.path.exists(dir_path):
+            self._make_dirs(dir_path)
+        
+        key = f"{file_id},{file_path}"
+        
+        if action == "delete":
+            # ファイル削除
+            if os.path.exists(full_path):
+                self._snapshot(full_path)
+                os.remove(full_path)
+                debug_logger.log(f"ファイル削除: {full_path}")
+                print_info(f"ファイル削除: {full_path}")
+            else:
+                debug_logger.log(f"警告: 削除対象ファイル {full_path} が見つかりません")
+                print_info(f"★警告: 削除対象ファイル {full_path} が見つかりません")
+        
+        elif action == "new":
+            # 新規ファイル作成
+            if key in self.binary_contents:
+                self._snapshot(full_path)
+                self._write_binary_file(full_path, self.binary_contents[key])
+                metrics.inc("procedure_parser_bytes_written_total", value=os.path.getsize(full_path))
+                debug_logger.log(f"バイナリファイル作成: {full_path}")
+                print_info(f"バイナリファイル作成: {full_path}")
+            elif key in self.file_contents:
+                self._snapshot(full_path)
+                self._write_text_file(full_path, self.file_contents[key])
+                metrics.inc("procedure_parser_bytes_written_total", value=os.path.getsize(full_path))
+                self._mark_touched(file_id, file_path, full_path)
+                debug_logger.log(f"ファイル作成: {full_path}")
+                print_info(f"ファイル作成: {full_path}")
+            else:
+                debug_logger.log(f"警告: ファイル {file_path} の内容が見つかりません")
+                print_info(f"★警告: ファイル {file_path} の内容が見つかりません")
+        
+        elif action == "modify":
+            # ファイル修正
+            if key in self.file_modifications and os.path.exists(full_path):
+                self._snapshot(full_path)
+                self._modify_file(full_path, self.file_modifications[key])
+                self._mark_touched(file_id, file_path, full_path)
+                debug_logger.log(f"ファイル更新: {full_path}")
+                print_info(f"ファイル更新: {full_path}")
+            else:
+                debug_logger.log(f"警告: ファイル {file_path} の修正情報が見つからないか、ファイルが存在しません")
+                print_info(f"★警告: ファイル {file_path} の修正情報が見つからないか、ファイルが存在しません")
+    
+    def _write_text_file(self, full_path, content):
+        """テキストファイルを書き込む（既存ファイルを上書きする場合はエンコーディング・BOM・改行コードを引き継ぐ）"""
+        existing = None
+        if os.path.isfile(full_path):
+            with open(full_path, 'rb') as f:
+                existing = f.read()
+        data = render_text_file(content, existing, full_path)
+        with open(full_path, 'wb') as f:
+            f.write(data)
+    
+    def _write_binary_file(self, full_path, binary):
+        """base64 のペイロードをチャンクごとにデコードしながら書き込み、サイズとハッシュを確認する"""
+        start, end = binary["span"]
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = full_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for data in iter_binary_payload(binary["source"], start, end, binary["encoding"], max_size=binary["size"]):
+                    f.write(data)
+                    digest.update(data)
+                    size += len(data)
+            if binary["size"] is not None and size != binary["size"]:
+                raise ValueError(f"サイズが一致しません（宣言: {binary['size']} バイト、実際: {size} バイト）")
+            if binary["sha256"] is not None and digest.hexdigest() != binary["sha256"]:
+                raise ValueError("sha256 が一致しません")
+            os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _mark_touched(self, file_id, file_path, full_path):
+        """書き込んだファイルを記録する（構文チェック・ステージングの対象）"""
+        if not any(entry["full_path"] == full_path for entry in self.touched_files):
+            self.touched_files.append({"id": file_id, "path": file_path, "full_path": full_path})
+    
+    def _write_run_script(self, base_dir):
+        """実行コマンドをbat/shファイルとして保存する"""
+        if not self.run_commands:
+            return
+        script_name, script_content = render_run_script(self.run_commands)
+        script_path = os.path.join(base_dir, script_name)
+        self._snapshot(script_path)
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write(script_content)
+        if os.name != 'nt':
+            os.chmod(script_path, 0o755)  # 実行権限を付与
+        debug_logger.log(f"実行スクリプト作成: {script_path}")
+        print_info(f"実行スクリプト作成: {script_path}")
+    
+    def _snapshot(self, full_path):
+        """ロールバック用に、最初に変更する前のファイル内容を記録する（存在しなければ None）"""
+        if full_path in self._snapshots:
+            return
+        if os.path.exists(full_path):
+            with open(full_path, 'rb') as f:
+                self._snapshots[full_path] = f.read()
+        else:
+            self._snapshots[full_path] = None
+    
+    def _make_dirs(self, dir_path):
+        """ディレクトリを作成し、新たに作成したディレクトリをロールバック用に記録する"""
+        missing = []
+        path = os.path.normpath(dir_path)
+        while path and not os.path.exists(path):
+            missing.append(path)
+            path = os.path.dirname(path)
+        os.makedirs(dir_path)
+        self._created_dirs.extend(reversed(missing))
+        debug_logger.log(f"ディレクトリ作成: {dir_path}")
+        print_info(f"ディレクトリ作成: {dir_path}")
+    
+    def rollback(self):
+        """create_project_structure で変更したファイルを変更前の状態に戻す"""
+        debug_logger.log(f"ロールバックを開始: {len(self._snapshots)} ファイル")
+        for full_path, original in reversed(list(self._snapshots.items())):
+            if original is None:
+                if os.path.exists(full_path):
+                    os.remove(full_path)
+            else:
+                with open(full_path, 'wb') as f:
+                    f.write(original)
+            debug_logger.log(f"ロールバック: {full_path}")
+            print_info(f"ロールバック: {full_path}")
+        # 作成したディレクトリは、深い順に空のものだけ削除する
+        for dir_path in reversed(self._created_dirs):
+            if os.path.isdir(dir_path) and not os.listdir(dir_path):
+                os.rmdir(dir_path)
+                debug_logger.log(f"ロールバック: ディレクトリ {dir_path} を削除")
+                print_info(f"ロールバック: ディレクトリ {dir_path} を削除")
+        self._snapshots = {}
+        self._created_dirs = []
+        self.touched_files = []
     
     def _modify_file(self, file_path, modifications):
-        """ファイルの特定範囲を修正する"""
+        """ファイルの特定範囲を修正する（エンコーディング・BOM・改行コードは元のファイルのまま）"""
+        backup_path = file_path + ".bak"
         try:
             debug_logger.log(f"ファイル修正: {file_path}")
             
@@ -496,180 +1535,25 @@ class ProcedureParser:
                 print_info(f"★注意: {file_path} は除外リストに含まれるため、自動処理されません。手動で修正してください。")
                 return
             
-            # ファイル内容の読み込み
-            with open(file_path, 'r', encoding='utf-8') as f:
+            # ファイル内容の読み込み（デコードせずにバイト列のまま扱う）
+            with open(file_path, 'rb') as f:
                 content = f.read()
-                original_content = content  # バックアップ用
                 debug_logger.log(f"ファイル内容を読み込みました ({len(content)} バイト)")
                 debug_logger.log_file_content(f"{file_path}_original.txt", content)
             
             print_info(f"ファイル {file_path} の内容を読み込みました（{len(content)}バイト）")
             
             # バックアップの作成
-            backup_path = file_path + ".bak"
             shutil.copy2(file_path, backup_path)
             debug_logger.log(f"バックアップを作成しました: {backup_path}")
             
-            # 変更フラグ
-            changed = False
-            
-            # 各修正区間を処理
-            for mod in modifications:
-                start_code = mod["start"]
-                end_code = mod["end"]
-                new_content = mod["content"]
-                
-                debug_logger.log(f"修正処理: コード管理番号 #{start_code}-#{end_code}")
-                print_info(f"修正処理: コード管理番号 #{start_code}-#{end_code}")
-                
-                # ファイル拡張子からファイル種別を判断
-                _, ext = os.path.splitext(file_path.lower())
-                
-                # コード管理番号を検索するパターンを作成
-                # HTMLコメントやその他のコメント形式を考慮
-                patterns = []
-                
-                # HTML/XMLファイル用パターン
-                if ext in ['.html', '.htm', '.xml', '.svg']:
-                    patterns.extend([
-                        f"<!-- #{start_code} -->",  # HTMLコメント形式
-                        f"#{start_code}",           # 単純な形式（フォールバック）
-                    ])
-                # CSSファイル用パターン
-                elif ext in ['.css']:
-                    patterns.extend([
-                        f"/* #{start_code} */",     # CSSコメント形式
-                        f"#{start_code}",           # 単純な形式（フォールバック）
-                    ])
-                # PHPやJavaScript等のC系言語用パターン
-                elif ext in ['.php', '.js', '.ts', '.java', '.cs', '.cpp', '.c', '.h']:
-                    patterns.extend([
-                        f"// #{start_code}",        # 単一行コメント形式
-                        f"/* #{start_code} */",     # 複数行コメント形式
-                        f"#{start_code}",           # 単純な形式（フォールバック）
-                    ])
-                # Python、Ruby、シェルスクリプト用パターン
-                elif ext in ['.py', '.rb', '.sh', '.yml', '.yaml']:
-                    patterns.extend([
-                        f"# #{start_code}",         # シャープコメント形式
-                        f"#{start_code}",           # 単純な形式（フォールバック）
-                    ])
-                # デフォルトパターン（すべての形式を試す）
-                else:
-                    patterns.extend([
-                        f"<!-- #{start_code} -->",  # HTMLコメント形式
-                        f"// #{start_code}",        # 単一行コメント形式
-                        f"/* #{start_code} */",     # 複数行コメント形式
-                        f"# #{start_code}",         # シャープコメント形式
-                        f"#{start_code}",           # 単純な形式（フォールバック）
-                    ])
-                
-                # 開始マーカーを検索
-                start_pos = -1
-                start_marker_used = None
-                
-                for pattern in patterns:
-                    debug_logger.log(f"パターン '{pattern}' で開始マーカーを検索")
-                    pos = content.find(pattern)
-                    if pos != -1:
-                        start_pos = pos
-                        start_marker_used = pattern
-                        debug_logger.log(f"開始マーカー '{pattern}' を位置 {pos} で見つけました")
-                        break
-                
-                if start_pos == -1:
-                    debug_logger.log(f"開始マーカー '#{start_code}' が見つかりません。この修正はスキップします。")
-                    print_info(f"★開始マーカー '#{start_code}' が見つかりません。この修正はスキップします。")
-                    continue
-                
-                debug_logger.log(f"開始マーカー '{start_marker_used}' を位置 {start_pos} で見つけました")
-                print_info(f"開始マーカー '{start_marker_used}' を位置 {start_pos} で見つけました")
-                
-                # 終了マーカーを検索するパターンを作成
-                end_patterns = []
-                
-                # HTML/XMLファイル用パターン
-                if ext in ['.html', '.htm', '.xml', '.svg']:
-                    end_patterns.extend([
-                        f"<!-- #{end_code} -->",    # HTMLコメント形式
-                        f"#{end_code}",             # 単純な形式（フォールバック）
-                    ])
-                # CSSファイル用パターン
-                elif ext in ['.css']:
-                    end_patterns.extend([
-                        f"/* #{end_code} */",       # CSSコメント形式
-                        f"#{end_code}",             # 単純な形式（フォールバック）
-                    ])
-                # PHPやJavaScript等のC系言語用パターン
-                elif ext in ['.php', '.js', '.ts', '.java', '.cs', '.cpp', '.c', '.h']:
-                    end_patterns.extend([
-                        f"// #{end_code}",          # 単一行コメント形式
-                        f"/* #{end_code} */",       # 複数行コメント形式
-                        f"#{end_code}",             # 単純な形式（フォールバック）
-                    ])
-                # Python、Ruby、シェルスクリプト用パターン
-                elif ext in ['.py', '.rb', '.sh', '.yml', '.yaml']:
-                    end_patterns.extend([
-                        f"# #{end_code}",           # シャープコメント形式
-                        f"#{end_code}",             # 単純な形式（フォールバック）
-                    ])
-                # デフォルトパターン（すべての形式を試す）
-                else:
-                    end_patterns.extend([
-                        f"<!-- #{end_code} -->",    # HTMLコメント形式
-                        f"// #{end_code}",          # 単一行コメント形式
-                        f"/* #{end_code} */",       # 複数行コメント形式
-                        f"# #{end_code}",           # シャープコメント形式
-                        f"#{end_code}",             # 単純な形式（フォールバック）
-                    ])
-                
-                # 終了マーカーを検索 (開始位置以降を検索)
-                end_pos = -1
-                end_marker_used = None
-                
-                for pattern in end_patterns:
-                    debug_logger.log(f"パターン '{pattern}' で終了マーカーを検索")
-                    pos = content.find(pattern, start_pos + len(start_marker_used))
-                    if pos != -1:
-                        end_pos = pos
-                        end_marker_used = pattern
-                        debug_logger.log(f"終了マーカー '{pattern}' を位置 {pos} で見つけました")
-                        break
-                
-                if end_pos == -1:
-                    debug_logger.log(f"終了マーカー '#{end_code}' が見つかりません。この修正はスキップします。")
-                    print_info(f"★終了マーカー '#{end_code}' が見つかりません。この修正はスキップします。")
-                    continue
-                
-                debug_logger.log(f"終了マーカー '{end_marker_used}' を位置 {end_pos} で見つけました")
-                print_info(f"終了マーカー '{end_marker_used}' を位置 {end_pos} で見つけました")
-                
-                # 終了マーカーのサイズを加える
-                end_pos += len(end_marker_used)
-                
-                # この範囲を新しい内容で置き換え
-                before = content[start_pos:end_pos]
-                debug_logger.log(f"置換前の内容: {before[:200]}...")
-                debug_logger.log_file_content(f"{file_path}_replace_before.txt", before)
-                print_info(f"置換前の内容: {before[:100]}...")
-                
-                # 新しい内容を出力
-                preview = new_content[:100] + ("..." if len(new_content) > 100 else "")
-                debug_logger.log(f"新しい内容: {preview}")
-                debug_logger.log_file_content(f"{file_path}_replace_after.txt", new_content)
-                print_info(f"新しい内容: {preview}")
-                
-                # 置換を実行
-                content = content[:start_pos] + new_content + content[end_pos:]
-                changed = True
-                
-                debug_logger.log(f"置換が完了しました")
-                print_info(f"置換が完了しました")
+            content, changed = splice_modifications(content, file_path, modifications)
             
             # 変更があった場合のみファイルを書き込む
             if changed:
-                with open(file_path, 'w', encoding='utf-8') as f:
+                with open(file_path, 'wb') as f:
                     f.write(content)
+                metrics.inc("procedure_parser_bytes_written_total", value=len(content))
                 debug_logger.log(f"ファイル {file_path} を更新しました")
                 debug_logger.log_file_content(f"{file_path}_updated.txt", content)
                 print_info(f"ファイル {file_path} を更新しました")
@@ -714,80 +1598,152 @@ class ProcedureParser:
         
         return '\n'.join(indented_lines)
         
-    def perform_git_operations(self, base_dir, skip_confirmation=False):
-        """Git操作を実行する"""
+    def get_commit_message(self):
+        """コミットメッセージを決定する（最初のファイルのコミットメッセージを使用）"""
+        if not self.file_list:
+            return None
+        first_file = self.file_list[0]
+        key = f"{first_file['id']},{first_file['path']}"
+        return self.commit_messages.get(key, f"{self.app_name} の更新")
+    
+    def _staging_pathspec(self, base_dir):
+        """ステージングするパスのリストを返す（絞り込みを指定していない場合は None で、すべての変更を対象にする）"""
+        if not self.entry_filter:
+            return None
+        paths = [entry["path"] for entry in self.file_list if not is_excluded_file(entry["path"])]
+        if self.run_commands:
+            paths.append(render_run_script(self.run_commands)[0])
+        return list(dict.fromkeys(paths))
+    
+    @staticmethod
+    def _drop_ignored_paths(base_dir, paths):
+        """.gitignore で無視されるパスを除く（git add . と同じく、無視されるファイルはステージングしない）"""
+        if not paths:
+            return paths
+        result = subprocess.run(["git", "check-ignore", "--stdin"], cwd=base_dir, input="\n".join(paths) + "\n",
+                                capture_output=True, text=True)
+        # 終了コード 1 は無視されるパスがない場合
+        if result.returncode not in (0, 1):
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        ignored = set(result.stdout.splitlines())
+        for path in ignored:
+            debug_logger.log(f"Git: {path} は .gitignore で無視されるためステージングしません")
+        return [path for path in paths if path not in ignored]
+    
+    def start_git_commit(self, base_dir, skip_confirmation=False):
+        """変更をステージングし、git commit をサブプロセスとして非同期に開始する
+        
+        コミットを開始した場合は finish_git_commit に渡すハンドルを、それ以外は None を返す
+        """
         debug_logger.log(f"Git操作を開始: {base_dir}")
         try:
-            # カレントディレクトリを変更
-            original_dir = os.getcwd()
-            os.chdir(base_dir)
-            debug_logger.log(f"カレントディレクトリを変更: {base_dir}")
-            
-            # git add
-            subprocess.run(["git", "add", "."], check=True)
+            # git add（カレントディレクトリは変更せず、cwd で対象を指定する）
+            pathspec = self._staging_pathspec(base_dir)
+            if pathspec is None:
+                subprocess.run(["git", "add", "."], cwd=base_dir, check=True)
+            else:
+                # 絞り込みを指定した場合は、適用したファイルと実行スクリプトのみをステージングする
+                existing = [path for path in pathspec if os.path.lexists(os.path.join(base_dir, path))]
+                removed = [path for path in pathspec if path not in existing]
+                existing = self._drop_ignored_paths(base_dir, existing)
+                if existing:
+                    subprocess.run(["git", "add", "--"] + existing, cwd=base_dir, check=True)
+                if removed:
+                    subprocess.run(["git", "rm", "--cached", "--ignore-unmatch", "-q", "--"] + removed, cwd=base_dir, check=True)
             debug_logger.log("Git: ファイルを追加しました")
             print_info("Git: ファイルを追加しました")
             
             # git status を実行して変更を確認
-            status_output = subprocess.run(["git", "status", "--porcelain"], check=True, capture_output=True, text=True).stdout
+            status_command = ["git", "status", "--porcelain"]
+            if pathspec is not None:
+                status_command += ["--"] + pathspec
+            status_output = subprocess.run(status_command, cwd=base_dir, check=True, capture_output=True, text=True).stdout
             debug_logger.log(f"Git status 出力:\n{status_output}")
             
-            # コミットメッセージを決定
-            # 最初のファイルのコミットメッセージを使用
-            if self.file_list and len(self.file_list) > 0:
-                first_file = self.file_list[0]
-                file_id = first_file["id"]
-                file_path = first_file["path"]
-                key = f"{file_id},{file_path}"
-                
-                commit_message = self.commit_messages.get(key, f"{self.app_name} の更新")
-                debug_logger.log(f"コミットメッセージ: {commit_message}")
-                
-                # git commit
-                try:
-                    # 変更があるかチェック
-                    if status_output.strip():
-                        # 確認が必要かどうかをチェック
-                        commit_confirmed = True
-                        if not skip_confirmation:
-                            print_info(f"\nGitコミットを実行します。")
-                            print_info(f"コミットメッセージ: {commit_message}")
-                            print_info(f"変更されたファイル:")
-                            print_info(status_output)
-                            response = input("コミットしてもよろしいですか？ (y/n): ")
-                            commit_confirmed = response.lower() == 'y'
-                        
-                        if commit_confirmed:
-                            # 変更がある場合のみコミット
-                            commit_result = subprocess.run(["git", "commit", "-m", commit_message], check=True, capture_output=True, text=True)
-                            debug_logger.log(f"Git commit 出力:\n{commit_result.stdout}")
-                            debug_logger.log(f"Git: コミット完了 - {commit_message}")
-                            print_info(f"Git: コミット完了 - {commit_message}")
-                        else:
-                            debug_logger.log("Git: ユーザーがコミットをキャンセルしました")
-                            print_info("Git: コミットがキャンセルされました")
-                    else:
-                        debug_logger.log("Git: 変更がないため、コミットはスキップされました")
-                        print_info("★Git: 変更がないため、コミットはスキップされました")
-                except subprocess.CalledProcessError as e:
-                    debug_logger.log(f"Git: コミット中にエラーが発生しました: {e}")
-                    debug_logger.log(f"エラー出力: {e.stderr}")
-                    print_info(f"★Git: コミット中にエラーが発生しました: {e}")
-            else:
+            commit_message = self.get_commit_message()
+            if commit_message is None:
                 debug_logger.log("警告: コミットするファイルがありません")
                 print_info("★警告: コミットするファイルがありません")
+                return None
+            debug_logger.log(f"コミットメッセージ: {commit_message}")
+            
+            # 絞り込み時は、インデックスにある他の変更を含めないよう、ステージングしたパスのみをコミットする
+            commit_command = ["git", "commit", "-m", commit_message]
+            if pathspec is not None:
+                staged = subprocess.run(["git", "diff", "--cached", "--name-only", "--relative", "-z", "--"] + pathspec,
+                                        cwd=base_dir, check=True, capture_output=True, text=True).stdout
+                staged = [path for path in staged.split('\0') if path]
+                debug_logger.log(f"Git: コミット対象のパス: {staged}")
+                if not staged:
+                    status_output = ""
+                commit_command += ["--"] + staged
             
-            # カレントディレクトリを戻す
-            os.chdir(original_dir)
-            debug_logger.log(f"カレントディレクトリを元に戻しました: {original_dir}")
+            # 変更があるかチェック
+            if not status_output.strip():
+                debug_logger.log("Git: 変更がないため、コミットはスキップされました")
+                print_info("★Git: 変更がないため、コミットはスキップされました")
+                return None
             
+            # 確認が必要かどうかをチェック
+            if not skip_confirmation:
+                response = ask_user("コミットしてもよろしいですか？ (y/n): ", notice=[
+                    "\nGitコミットを実行します。",
+                    f"コミットメッセージ: {commit_message}",
+                    "変更されたファイル:",
+                    status_output,
+                ])
+                if response.lower() != 'y':
+                    debug_logger.log("Git: ユーザーがコミットをキャンセルしました")
+                    print_info("Git: コミットがキャンセルされました")
+                    return None
+            
+            # 変更がある場合のみコミット
+            process = subprocess.Popen(commit_command, cwd=base_dir,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            debug_logger.log(f"Git: コミットを開始しました (pid={process.pid})")
+            return {"process": process, "message": commit_message, "started": time.monotonic()}
+        
         except subprocess.CalledProcessError as e:
+            self.git_error = e
+            metrics.inc("procedure_parser_git_failures_total")
             debug_logger.log(f"Git操作中にエラーが発生しました: {e}")
             debug_logger.log(f"エラー出力: {e.stderr if hasattr(e, 'stderr') else 'なし'}")
             print_info(f"★Git操作中にエラーが発生しました: {e}")
         except Exception as e:
-            debug_logger.log(f"エラー: {e}")
-            print_info(f"★エラー: {e}")
+            self.git_error = e
+            metrics.inc("procedure_parser_git_failures_total")
+            debug_logger.log(f"エラー: {e!r}")
+            print_info(f"★エラー: {e!r}")
+        return None
+    
+    @staticmethod
+    def finish_git_commit(commit_handle):
+        """start_git_commit で開始したコミットの完了を待ち、結果を表示する"""
+        if commit_handle is None:
+            return False
+        process = commit_handle["process"]
+        commit_message = commit_handle["message"]
+        stdout, stderr = process.communicate()
+        metrics.observe("procedure_parser_stage_duration_seconds", time.monotonic() - commit_handle["started"], {"stage": "git_commit"})
+        if process.returncode != 0:
+            metrics.inc("procedure_parser_git_failures_total")
+            e = subprocess.CalledProcessError(process.returncode, process.args, stdout, stderr)
+            debug_logger.log(f"Git: コミット中にエラーが発生しました: {e}")
+            debug_logger.log(f"エラー出力: {e.stderr}")
+            print_info(f"★Git: コミット中にエラーが発生しました: {e}")
+            return False
+        debug_logger.log(f"Git commit 出力:\n{stdout}")
+        debug_logger.log(f"Git: コミット完了 - {commit_message}")
+        print_info(f"Git: コミット完了 - {commit_message}")
+        return True
+    
+    def perform_git_operations(self, base_dir, skip_confirmation=False):
+        """Git操作を実行する"""
+        commit_handle = self.start_git_commit(base_dir, skip_confirmation)
+        committed = self.finish_git_commit(commit_handle)
+        if self.git_error is not None or (commit_handle is not None and not committed):
+            self.commit_failed = True
+        return committed
     
     def generate_summary(self):
         """解析した内容のサマリーを表示する"""
@@ -805,8 +1761,79 @@ class ProcedureParser:
         print_info("========================\n")
         debug_logger.log("サマリーの生成が完了しました")
 
-def save_procedure_copy(procedure_content, howto_dir):
-    """手順書をHowToBookフォルダに保存する"""
+def _check_file_syntax(task):
+    """1ファイルの構文をチェックする（プロセスプールのワーカーで実行される）"""
+    file_id, full_path, command = task
+    try:
+        if command is None:
+            with open(full_path, 'rb') as f:
+                compile(f.read(), full_path, 'exec', dont_inherit=True)
+            return file_id, full_path, True, ""
+        result = subprocess.run(command + [full_path], capture_output=True, text=True, timeout=60)
+        message = (result.stderr or result.stdout).strip()
+        return file_id, full_path, result.returncode == 0, message
+    except SyntaxError as e:
+        return file_id, full_path, False, f"{e.msg} (行 {e.lineno})"
+    except Exception as e:
+        return file_id, full_path, False, str(e)
+
+
+class SyntaxVerifier:
+    """書き込み後のファイルの構文を言語ごとのチェッカーで並列に検証するクラス"""
+    
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.errors = []  # [{'id': '00001', 'path': 'out/file.py', 'message': '...'}]
+    
+    def _get_task(self, file_entry):
+        """ファイルに対応するチェックタスクを作成する。チェッカーがなければ None"""
+        _, ext = os.path.splitext(file_entry["full_path"].lower())
+        if ext == '.py':
+            return (file_entry["id"], file_entry["full_path"], None)
+        command = SYNTAX_CHECKERS.get(ext)
+        if command is None:
+            return None
+        if shutil.which(command[0]) is None:
+            debug_logger.log(f"構文チェッカー {command[0]} がインストールされていないため {file_entry['full_path']} のチェックをスキップします")
+            return None
+        return (file_entry["id"], file_entry["full_path"], command)
+    
+    def verify(self, touched_files):
+        """ファイルの構文を検証する。すべて成功した場合に True を返す"""
+        with metrics.timer("procedure_parser_stage_duration_seconds", stage="verify"):
+            return self._verify(touched_files)
+    
+    def _verify(self, touched_files):
+        self.errors = []
+        tasks = [task for task in (self._get_task(entry) for entry in touched_files) if task is not None]
+        if not tasks:
+            debug_logger.log("構文チェックの対象ファイルはありません")
+            return True
+        
+        debug_logger.log(f"構文チェックを開始: {len(tasks)} ファイル")
+        print_info(f"構文チェックを実行しています（{len(tasks)} ファイル）")
+        max_workers = self.max_workers or min(len(tasks), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for file_id, full_path, ok, message in executor.map(_check_file_syntax, tasks):
+                if ok:
+                    debug_logger.log(f"構文チェックOK: {file_id} {full_path}")
+                    continue
+                self.errors.append({"id": file_id, "path": full_path, "message": message})
+                debug_logger.log(f"構文エラー: ファイルID {file_id} ({full_path}): {message}")
+                print_info(f"★構文エラー: ファイルID {file_id} ({full_path}): {message}")
+        
+        debug_logger.log(f"構文チェック完了。エラー数: {len(self.errors)}")
+        return len(self.errors) == 0
+    
+    def get_errors(self):
+        """検証エラーを取得"""
+        return self.errors
+
+def save_procedure_copy(procedure_content, howto_dir, entry_filter=None):
+    """手順書をHowToBookフォルダに保存する
+    
+    絞り込み（entry_filter）を指定した場合は、verify で同じ範囲を再生できるよう条件を <番号>.filter.json に記録する
+    """
     debug_logger.log(f"手順書のコピーを保存: {howto_dir}")
     try:
         if not os.path.exists(howto_dir):
@@ -830,6 +1857,9 @@ def save_procedure_copy(procedure_content, howto_dir):
         # 保存
         with open(os.path.join(howto_dir, new_filename), 'w', encoding='utf-8') as f:
             f.write(procedure_content)
+        if entry_filter:
+            with open(os.path.join(howto_dir, f"{new_num:05d}.filter.json"), 'w', encoding='utf-8') as f:
+                json.dump(entry_filter.to_dict(), f, ensure_ascii=False)
         
         debug_logger.log(f"手順書を保存しました: {new_filename}")
         print_info(f"手順書を保存しました: {new_filename}")
@@ -840,25 +1870,724 @@ def save_procedure_copy(procedure_content, howto_dir):
         print_info(f"★手順書の保存に失敗しました: {e}")
         return None
 
-def main():
-    # コマンドライン引数のパース
-    parser = argparse.ArgumentParser(description='手順書パーサー v2.1.0')
-    parser.add_argument('procedure_file', help='手順書ファイルのパス')
+# 適用計画ファイルの形式
+PLAN_FORMAT = "procedure-plan"
+PLAN_FORMAT_VERSION = 1
+
+def compile_procedure_plan(procedure_parser):
+    """解析済みの手順書から適用計画を作成する
+    
+    ファイルの内容と修正区間は手順書内の位置（文字オフセット）として記録し、
+    適用時は元の手順書から切り出す
+    """
+    modifications = {}
+    for key, mods in procedure_parser.file_modifications.items():
+        modifications[key] = [{name: value for name, value in mod.items() if name != "content"} for mod in mods]
+    return {
+        "format": PLAN_FORMAT,
+        "format_version": PLAN_FORMAT_VERSION,
+        "tool_version": VERSION,
+        "source": os.path.abspath(procedure_parser.procedure_file_path),
+        "source_sha256": procedure_parser.procedure_hash,
+        "app_name": procedure_parser.app_name,
+        "version": procedure_parser.version,
+        "run_commands": procedure_parser.run_commands,
+        "file_list": procedure_parser.file_list,
+        "commit_messages": procedure_parser.commit_messages,
+        "contents": procedure_parser.content_spans,
+        "binaries": {key: {name: value for name, value in binary.items() if name != "source"}
+                     for key, binary in procedure_parser.binary_contents.items()},
+        "modifications": modifications,
+    }
+
+def save_procedure_plan(plan, plan_path):
+    """適用計画をJSONファイルとして保存する"""
+    plan_dir = os.path.dirname(plan_path)
+    if plan_dir:
+        os.makedirs(plan_dir, exist_ok=True)
+    tmp_path = plan_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, plan_path)
+    debug_logger.log(f"適用計画を保存しました: {plan_path}")
+
+def load_procedure_plan(plan_path, source_path=None, entry_filter=None):
+    """適用計画を読み込み、元の手順書のハッシュとツールのバージョンを確認する"""
+    try:
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+    except Exception as e:
+        debug_logger.log(f"エラー: 適用計画の読み込みに失敗しました: {e}")
+        print_info(f"エラー: 適用計画の読み込みに失敗しました: {e}")
+        sys.exit(1)
+    
+    if plan.get("format") != PLAN_FORMAT or plan.get("format_version") != PLAN_FORMAT_VERSION:
+        print_info(f"エラー: {plan_path} は対応している適用計画ファイルではありません")
+        sys.exit(1)
+    if plan.get("tool_version") != VERSION:
+        print_info(f"エラー: 適用計画はスクリプトのバージョン {plan.get('tool_version')} で作成されています（現在のバージョン: {VERSION}）。compile し直してください")
+        sys.exit(1)
+    
+    source_path = source_path or plan["source"]
+    try:
+        with open(source_path, 'r', encoding='utf-8') as f:
+            procedure_content = f.read()
+    except Exception as e:
+        debug_logger.log(f"エラー: 元の手順書の読み込みに失敗しました: {e}")
+        print_info(f"エラー: 元の手順書 {source_path} の読み込みに失敗しました: {e}")
+        sys.exit(1)
+    
+    source_hash = hashlib.sha256(procedure_content.encode('utf-8')).hexdigest()
+    if source_hash != plan["source_sha256"]:
+        print_info(f"エラー: 元の手順書 {source_path} の内容が適用計画の作成時から変更されています。compile し直してください")
+        sys.exit(1)
+    
+    debug_logger.log(f"適用計画を読み込みました: {plan_path} (元の手順書: {source_path})")
+    return ProcedureParser.from_plan(plan, procedure_content, source_path, entry_filter)
+
+
+class Checkpoint:
+    """手順書の適用状況を操作ごとに記録するクラス
+    
+    手順書のハッシュごとに1ファイルを作成し、完了した操作のファイルIDを記録する。
+    中断後に --resume で再実行すると、未完了の操作から再開できる。
+    """
+    
+    def __init__(self, checkpoint_dir, procedure_hash):
+        self.checkpoint_dir = checkpoint_dir
+        self.procedure_hash = procedure_hash
+        self.path = os.path.join(checkpoint_dir, f"{procedure_hash}.json")
+        self.completed_ids = []
+        self.saved_procedure = None
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    def load(self):
+        """チェックポイントを読み込む。存在しない場合は False を返す"""
+        if not self.exists():
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("procedure_hash") != self.procedure_hash:
+            debug_logger.log(f"警告: チェックポイント {self.path} のハッシュが一致しないため無視します")
+            return False
+        self.completed_ids = data.get("completed_ids", [])
+        self.saved_procedure = data.get("saved_procedure")
+        debug_logger.log(f"チェックポイントを読み込みました: {self.path} (完了済み {len(self.completed_ids)} 件)")
+        return True
+    
+    def save(self):
+        """チェックポイントを書き込む（中断に備えて一時ファイルから置き換える）"""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        data = {
+            "procedure_hash": self.procedure_hash,
+            "saved_procedure": self.saved_procedure,
+            "completed_ids": self.completed_ids,
+            "updated_at": datetime.datetime.now().isoformat(),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def reset(self):
+        self.completed_ids = []
+        self.saved_procedure = None
+    
+    def is_completed(self, file_id):
+        return file_id in self.completed_ids
+    
+    def mark_completed(self, file_id):
+        self.completed_ids.append(file_id)
+        self.save()
+        debug_logger.log(f"チェックポイント記録: ファイルID {file_id}", also_print=False)
+    
+    def clear(self):
+        """適用が完了したチェックポイントを削除する"""
+        if self.exists():
+            os.remove(self.path)
+            debug_logger.log(f"チェックポイントを削除しました: {self.path}")
+
+
+class PipelinedExecutor:
+    """複数の手順書を「解析・検証 → ファイル書き込み → Gitコミット」のパイプラインで順に適用するクラス
+    
+    次の手順書の解析・検証は現在の手順書の書き込みと並行してバックグラウンドスレッドで行い、
+    コミットは非同期のサブプロセスとして実行する。git add は直前のコミットの完了を待ってから
+    行うため、手順書ごとのコミット内容と順序は逐次適用した場合と同一になる。
+    """
+    
+    def __init__(self, procedure_files, output_dir, howto_dir, skip_confirmation=False, verify_syntax=False,
+                 resume=False, loader=None, queue_size=1, entry_filter=None):
+        self.procedure_files = procedure_files
+        # 手順書（または適用計画）を読み込んで ProcedureParser を返す関数
+        self.loader = loader
+        self.output_dir = output_dir
+        self.howto_dir = howto_dir
+        self.skip_confirmation = skip_confirmation
+        self.verify_syntax = verify_syntax
+        self.resume = resume
+        self.entry_filter = entry_filter
+        self.commit_failed = False  # いずれかの手順書のGit操作またはコミットに失敗した場合は True
+        self.checkpoint_dir = os.path.join(howto_dir, ".checkpoints")
+        # 解析済みで書き込み待ちの手順書の最大数（先読みしすぎないよう制限する）
+        self.queue_size = queue_size
+    
+    def load_procedure(self, procedure_file):
+        """手順書を読み込んで解析・検証する（解析ステージで実行される）"""
+        with metrics.timer("procedure_parser_stage_duration_seconds", stage="parse"):
+            if self.loader:
+                return self.loader(procedure_file)
+            procedure_parser = ProcedureParser(procedure_file)
+            procedure_parser.entry_filter = self.entry_filter
+            return procedure_parser.parse()
+    
+    def run(self):
+        """パイプラインを実行する"""
+        parsed_queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        parse_thread = threading.Thread(target=self._parse_stage, args=(parsed_queue, stop_event), daemon=True)
+        parse_thread.start()
+        debug_logger.log(f"パイプライン実行を開始: {len(self.procedure_files)} 件の手順書")
+        
+        commit_handle = None
+        try:
+            while True:
+                item = parsed_queue.get()
+                if item is None:
+                    break
+                procedure_file, procedure_parser, error = item
+                if error is not None:
+                    debug_logger.log(f"手順書 {procedure_file} の解析ステージでエラーが発生しました: {error!r}")
+                    raise error
+                debug_logger.log(f"書き込みステージ: {procedure_file}")
+                commit_handle = self._apply_stage(procedure_parser, commit_handle)
+        finally:
+            stop_event.set()
+            # 最後のコミットの完了を待つ
+            self._finish_commit(commit_handle)
+        debug_logger.log("パイプライン実行が完了しました")
+    
+    def _parse_stage(self, parsed_queue, stop_event):
+        """解析ステージ: 手順書を順に解析し、キューに渡す"""
+        for procedure_file in self.procedure_files:
+            try:
+                debug_logger.log(f"解析ステージ: {procedure_file}")
+                item = (procedure_file, self.load_procedure(procedure_file), None)
+            except BaseException as e:  # parse() は検証エラー時に sys.exit するため SystemExit も受け渡す
+                item = (procedure_file, None, e)
+            if not self._put(parsed_queue, item, stop_event) or item[2] is not None:
+                return
+        self._put(parsed_queue, None, stop_event)
+    
+    def _put(self, parsed_queue, item, stop_event):
+        """書き込みステージが中断された場合に備えてタイムアウト付きでキューに入れる"""
+        while not stop_event.is_set():
+            try:
+                parsed_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _apply_stage(self, procedure_parser, previous_commit):
+        """書き込みステージ: ファイルを書き込み、直前のコミット完了後に次のコミットを開始する"""
+        checkpoint = self._prepare_checkpoint(procedure_parser)
+        # 中断前の実行で適用済みの操作（再開しない場合は空）
+        resumed_ids = list(checkpoint.completed_ids)
+        procedure_parser.generate_summary()
+        with metrics.timer("procedure_parser_stage_duration_seconds", stage="write"):
+            procedure_parser.create_project_structure(self.output_dir, checkpoint=checkpoint)
+        metrics.inc("procedure_parser_procedures_total")
+        
+        # 構文チェックに失敗した場合はコミット前にロールバックして中断する
+        if self.verify_syntax and not SyntaxVerifier().verify(
+                procedure_parser.touched_files + self._resumed_files(procedure_parser, resumed_ids)):
+            print_info("★構文エラーが見つかったため、この手順書の変更をロールバックします")
+            procedure_parser.rollback()
+            if resumed_ids:
+                # 中断前に適用済みの操作はロールバックできないため、手順書のコピーとチェックポイントを残し、
+                # 今回適用してロールバックした操作のみ未完了に戻す
+                checkpoint.completed_ids = resumed_ids
+                checkpoint.save()
+                print_info(f"★中断前に適用済みの {len(resumed_ids)} 件の操作はロールバックされずに残っています。"
+                           "--resume を指定して再実行すると、今回ロールバックした操作から再開します")
+                raise SystemExit(1)
+            if checkpoint.saved_procedure:
+                os.remove(os.path.join(self.howto_dir, checkpoint.saved_procedure))
+                filter_path = os.path.join(self.howto_dir, checkpoint.saved_procedure[:-len(".md")] + ".filter.json")
+                if os.path.exists(filter_path):
+                    os.remove(filter_path)
+                debug_logger.log(f"保存した手順書を削除しました: {checkpoint.saved_procedure}")
+            checkpoint.clear()
+            raise SystemExit(1)
+        
+        # インデックスを共有するため、直前のコミットが終わってからステージングする
+        self._finish_commit(previous_commit)
+        with metrics.timer("procedure_parser_stage_duration_seconds", stage="git_add"):
+            commit_handle = procedure_parser.start_git_commit(self.output_dir, skip_confirmation=self.skip_confirmation)
+        if commit_handle is None:
+            # Git操作自体が失敗した場合は、コミットのみ再試行できるようチェックポイントを残す
+            if procedure_parser.git_error is None:
+                checkpoint.clear()
+            else:
+                self.commit_failed = True
+                print_info("★Git操作に失敗しました。--resume を指定して再実行するとコミットのみ再試行します")
+            return None
+        commit_handle["checkpoint"] = checkpoint
+        return commit_handle
+    
+    def _resumed_files(self, procedure_parser, resumed_ids):
+        """中断前の実行で書き込んだテキストファイルを構文チェックの対象として返す"""
+        files = []
+        for file_entry in procedure_parser.file_list:
+            key = f"{file_entry['id']},{file_entry['path']}"
+            full_path = os.path.join(self.output_dir, file_entry["path"])
+            if (file_entry["id"] in resumed_ids and file_entry["type"] in ("new", "modify")
+                    and key not in procedure_parser.binary_contents and not is_excluded_file(file_entry["path"])
+                    and os.path.isfile(full_path)
+                    and not any(entry["full_path"] == full_path for entry in procedure_parser.touched_files)):
+                files.append({"id": file_entry["id"], "path": file_entry["path"], "full_path": full_path})
+        return files
+    
+    def _prepare_checkpoint(self, procedure_parser):
+        """チェックポイントを準備する。再開しない場合は手順書のコピーを保存して新しく記録を始める"""
+        checkpoint = Checkpoint(self.checkpoint_dir, procedure_parser.procedure_hash)
+        if self.resume and checkpoint.load():
+            print_info(f"チェックポイントから再開します（適用済み {len(checkpoint.completed_ids)} 件）")
+            return checkpoint
+        
+        saved_procedure = None
+        if checkpoint.load():
+            debug_logger.log(f"警告: 中断された適用の記録があります: {checkpoint.path}")
+            print_info("★警告: この手順書には中断された適用の記録があります。最初から適用し直します（再開するには --resume を指定してください）")
+            # 同じ内容の手順書が保存済みであれば、重複して保存しない
+            if checkpoint.saved_procedure and os.path.exists(os.path.join(self.howto_dir, checkpoint.saved_procedure)):
+                saved_procedure = checkpoint.saved_procedure
+        checkpoint.reset()
+        checkpoint.saved_procedure = saved_procedure or save_procedure_copy(procedure_parser.procedure_content, self.howto_dir,
+                                                                                procedure_parser.entry_filter)
+        checkpoint.save()
+        return checkpoint
+    
+    def _finish_commit(self, commit_handle):
+        if commit_handle is None:
+            return
+        if ProcedureParser.finish_git_commit(commit_handle):
+            commit_handle["checkpoint"].clear()
+        else:
+            self.commit_failed = True
+            print_info("★コミットに失敗しました。--resume を指定して再実行するとコミットのみ再試行します")
+
+def is_stream_source(procedure_file):
+    """手順書の指定が標準入力（-）または名前付きパイプ（FIFO）かどうかを判定する"""
+    if procedure_file == '-':
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(procedure_file).st_mode)
+    except OSError:
+        return False
+
+
+class StreamingProcedureApplier(ProcedureParser):
+    """生成中の手順書を標準入力または FIFO から読み込みながら適用するクラス
+    
+    ヘッダーとファイル一覧を検証した後は、ファイルセクションのコードブロックが閉じた時点で
+    そのセクション（修正の場合は修正区間ごと）を検証して適用する。
+    手順書全体の検証とGitコミットはストリームの終了後に行う。
+    """
+    
+    def __init__(self, procedure_file_path, base_dir, howto_dir, skip_confirmation=False, verify_syntax=False,
+                 entry_filter=None):
+        super().__init__(procedure_file_path)
+        self.entry_filter = entry_filter
+        self.base_dir = base_dir
+        self.howto_dir = howto_dir
+        self.skip_confirmation = skip_confirmation
+        self.verify_syntax = verify_syntax
+        # 標準入力が手順書そのものの場合は確認プロンプトを出せない
+        self.interactive = procedure_file_path != '-'
+        self._lines = []
+        self._applied_ids = set()
+    
+    def run(self):
+        """ストリームを読み込みながら適用し、終了後に検証とGitコミットを行う"""
+        debug_logger.log(f"ストリーミング適用を開始: {self.procedure_file_path}")
+        print_info(f"手順書をストリームから読み込みながら適用します: {self.procedure_file_path}")
+        if self.procedure_file_path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            stream = open(self.procedure_file_path, 'r', encoding='utf-8')
+        try:
+            with metrics.timer("procedure_parser_stage_duration_seconds", stage="stream"):
+                if self._read_header(stream):
+                    self._read_sections(stream)
+        finally:
+            if self.procedure_file_path != '-':
+                stream.close()
+        self._finish()
+        metrics.inc("procedure_parser_procedures_total")
+    
+    def _read_header(self, stream):
+        """「## ファイルの中身」までを読み込み、ヘッダーとファイル一覧を検証する"""
+        in_fence = False
+        for line in iter(stream.readline, ''):
+            self._lines.append(line)
+            text = line.rstrip('\r\n')
+            if text.startswith('```'):
+                in_fence = not in_fence
+            elif not in_fence and text == "## ファイルの中身":
+                break
+        else:
+            # ファイルの中身がないまま終了した場合は、終了後の全体の検証でエラーにする
+            return False
+        
+        self.procedure_content = ''.join(self._lines)
+        validator = ProcedureValidator(self.procedure_content)
+        if not validator.validate_header():
+            self._exit_with_errors(validator)
+        self._check_version_compatibility(validator.get_version())
+        self._parse_header()
+        self._filter_file_list()
+        self.generate_summary()
+        
+        if not os.path.exists(self.base_dir):
+            self._make_dirs(self.base_dir)
+        return True
+    
+    def _read_sections(self, stream):
+        """ファイルセクションを読み込み、コードブロックが閉じるたびに適用する"""
+        section = None
+        in_fence = False
+        for line in iter(stream.readline, ''):
+            index = len(self._lines)
+            self._lines.append(line)
+            text = line.rstrip('\r\n')
+            
+            if in_fence:
+                if text.startswith('```'):
+                    in_fence = False
+                    if section:
+                        self._on_block_closed(section, index)
+                continue
+            if text.startswith('```'):
+                in_fence = True
+                continue
+            
+            header_match = re.match(r'### (新規|修正|削除),(\d{5}),(.+)$', text)
+            if header_match:
+                action, file_id, file_path = header_match.groups()
+                section = {"action": action, "id": file_id, "path": file_path, "commit": None,
+                           "start": index, "block_start": index, "applied": False}
+                debug_logger.log(f"ファイルセクション受信: {action}, {file_id}, {file_path}")
+                # コミットメッセージは parse() と同じく、記載がなければ「アクション ファイルパス」にする
+                self.commit_messages[f"{file_id},{file_path}"] = f"{action} {file_path}"
+                if action == "削除":
+                    self._apply_section(section)
+                continue
+            if section is None:
+                continue
+            if text.startswith('## '):
+                # 備考などファイルの中身以外のセクション
+                section = None
+            elif index == section["start"] + 1 and text.startswith('コミット内容：'):
+                section["commit"] = text[len('コミット内容：'):]
+                # 削除はコミット内容の行より先に適用されるため、受信した時点で記録する
+                self.commit_messages[f"{section['id']},{section['path']}"] = section["commit"]
+            elif text.startswith('####'):
+                section["block_start"] = index
+    
+    def _on_block_closed(self, section, end_index):
+        """コードブロックが閉じた時点でセクション（修正の場合は修正区間）を検証して適用する"""
+        action = section["action"]
+        if not self._is_selected(section["id"], section["path"]):
+            # 絞り込みで除外したエントリは検証・抽出しない（ストリーム終了後の全体の検証は行う）
+            section["applied"] = True
+            return
+        if action == "新規" and not section["applied"]:
+            block_content = ''.join(self._lines[section["start"]:end_index + 1])
+        elif action == "修正":
+            block_content = ''.join(self._lines[section["block_start"]:end_index + 1])
+        else:
+            return
+        
+        validator = ProcedureValidator(block_content)
+        if not validator.validate_section(action, section["id"], section["path"], block_content):
+            self.rollback()
+            self._exit_with_errors(validator)
+        
+        commit_msg = section["commit"] or f"{action} {section['path']}"
+        self._parse_file_section(action, section["id"], section["path"], commit_msg, block_content)
+        self._apply_section(section)
+    
+    def _apply_section(self, section):
+        """セクションに対応するファイル一覧のエントリを適用する"""
+        file_entry = next((entry for entry in self.file_list
+                           if entry["id"] == section["id"] and entry["path"] == section["path"].strip()), None)
+        section["applied"] = True
+        if file_entry is None:
+            debug_logger.log(f"ファイルID {section['id']} はファイル一覧にないため適用しません")
+            return
+        self._try_apply_file_entry(self.base_dir, file_entry)
+        self._applied_ids.add(file_entry["id"])
+    
+    def _finish(self):
+        """ストリーム終了後に全体を検証し、未適用の操作・実行スクリプト・Gitコミットを処理する"""
+        self.procedure_content = ''.join(self._lines)
+        self.procedure_hash = hashlib.sha256(self.procedure_content.encode('utf-8')).hexdigest()
+        debug_logger.log(f"ストリームの読み込みが完了しました ({len(self.procedure_content)} バイト)")
+        debug_logger.log_file_content("procedure_full_content.md", self.procedure_content)
+        
+        validator = ProcedureValidator(self.procedure_content)
+        if self.entry_filter:
+            # 絞り込みで除外したセクションは内容を検証しない
+            valid = validator.validate_header() and validator.validate_sections(self._is_selected)
+        else:
+            valid = validator.validate()
+        if not valid:
+            self.rollback()
+            self._exit_with_errors(validator)
+        
+        notes_match = re.search(r'## 備考\n(.*?)(?=$)', self.procedure_content, re.DOTALL)
+        if notes_match:
+            self.notes = notes_match.group(1).strip()
+        
+        # 見出しのない削除など、まだ適用していない操作を適用する
+        for file_entry in self.file_list:
+            if file_entry["id"] not in self._applied_ids:
+                self._try_apply_file_entry(self.base_dir, file_entry)
+        self._write_run_script(self.base_dir)
+        
+        if self.verify_syntax and not SyntaxVerifier().verify(self.touched_files):
+            print_info("★構文エラーが見つかったため、この手順書の変更をロールバックします")
+            self.rollback()
+            sys.exit(1)
+        
+        save_procedure_copy(self.procedure_content, self.howto_dir, self.entry_filter)
+        self.perform_git_operations(self.base_dir, skip_confirmation=self.skip_confirmation)
+
+
+class DriftVerifier:
+    """HowToBook の手順書をメモリ上で再生し、出力ディレクトリとの差異（ドリフト）を検出する
+    
+    ファイルへの書き込みは一切行わない
+    """
+    
+    def __init__(self, output_dir, howto_dir, max_workers=None):
+        self.output_dir = output_dir
+        self.howto_dir = howto_dir
+        self.max_workers = max_workers
+        # {'相対パス': {'exists': bool, 'data': 期待する内容 または None, 'sha256': ..., 'regions': {...} または None, 'source': '00001.md'}}
+        self.expected = {}
+    
+    def run(self):
+        """再生と比較を行い、差異がなければ True を返す"""
+        procedure_files = sorted(f for f in os.listdir(self.howto_dir) if re.fullmatch(r'\d{5}\.md', f)) \
+            if os.path.isdir(self.howto_dir) else []
+        if not procedure_files:
+            print_info(f"エラー: HowToBookに手順書がありません: {self.howto_dir}")
+            sys.exit(1)
+        
+        started = time.monotonic()
+        for procedure_file in procedure_files:
+            self._replay(procedure_file)
+        debug_logger.log(f"HowToBookの再生が完了しました: {len(procedure_files)} 手順書, {len(self.expected)} ファイル "
+                         f"({time.monotonic() - started:.2f} 秒)")
+        
+        # 実際のファイルとの比較は並列に行う
+        paths = sorted(self.expected)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._compare, paths))
+        
+        drifted = [(path, problems) for path, (status, problems) in zip(paths, results) if status == "drift"]
+        unverified = [path for path, (status, _) in zip(paths, results) if status == "unverified"]
+        for path, problems in drifted:
+            print_info(f"★差異: {path}（最終更新: {self.expected[path]['source']}）")
+            for problem in problems:
+                print_info(f"    - {problem}")
+        for path in unverified:
+            print_info(f"★未検証: {path}（HowToBookに元の内容がなく、確認できる区間もありません）")
+        
+        print_info(f"\n検証結果: 管理ファイル {len(paths)} 件（一致 {len(paths) - len(drifted) - len(unverified)} 件、"
+                   f"差異 {len(drifted)} 件、未検証 {len(unverified)} 件）"
+                   f"（{len(procedure_files)} 手順書、{time.monotonic() - started:.2f} 秒）")
+        if not drifted:
+            print_info("出力ディレクトリはHowToBookの手順書の適用結果と一致しています")
+        return not drifted
+    
+    def _replay(self, procedure_file):
+        """1つの手順書の操作を、期待するファイルの状態に反映する"""
+        procedure_parser = ProcedureParser(os.path.join(self.howto_dir, procedure_file))
+        with open(procedure_parser.procedure_file_path, 'r', encoding='utf-8') as f:
+            procedure_parser.procedure_content = f.read()
+        # 絞り込みを指定して適用した手順書は、同じ条件で再生する
+        filter_path = os.path.join(self.howto_dir, procedure_file[:-len(".md")] + ".filter.json")
+        if os.path.exists(filter_path):
+            with open(filter_path, 'r', encoding='utf-8') as f:
+                procedure_parser.entry_filter = EntryFilter(**json.load(f))
+        
+        validator = ProcedureValidator(procedure_parser.procedure_content)
+        if not (validator.validate_header() if procedure_parser.entry_filter else validator.validate()):
+            self._exit_with_invalid(procedure_parser, procedure_file, validator)
+        
+        debug_logger.log(f"手順書を再生: {procedure_file}")
+        # 解析・置換時のメッセージは表示しない（デバッグログには記録される）
+        with contextlib.redirect_stdout(io.StringIO()):
+            procedure_parser._parse_header()
+            procedure_parser._filter_file_list()
+        if procedure_parser.entry_filter and not validator.validate_sections(procedure_parser._is_selected):
+            self._exit_with_invalid(procedure_parser, procedure_file, validator)
+        with contextlib.redirect_stdout(io.StringIO()):
+            procedure_parser._parse_file_sections()
+            for file_entry in procedure_parser.file_list:
+                if not is_excluded_file(file_entry["path"]):
+                    self._replay_entry(procedure_parser, file_entry, procedure_file)
+        
+        if procedure_parser.run_commands:
+            script_name, script_content = render_run_script(procedure_parser.run_commands)
+            self._set(script_name, procedure_file, data=script_content.replace('\n', os.linesep).encode('utf-8'))
+    
+    @staticmethod
+    def _exit_with_invalid(procedure_parser, procedure_file, validator):
+        print_info(f"★エラー: HowToBookの手順書 {procedure_file} のフォーマットが不正なため、検証できません")
+        procedure_parser._exit_with_errors(validator)
+    
+    def _replay_entry(self, procedure_parser, file_entry, procedure_file):
+        """ファイル一覧の1エントリ分の操作を再生する（_apply_file_entry と同じ規則）"""
+        path = os.path.normpath(file_entry["path"])
+        key = f"{file_entry['id']},{file_entry['path']}"
+        current = self.expected.get(path)
+        
+        if file_entry["type"] == "delete":
+            self.expected[path] = {"exists": False, "data": None, "sha256": None, "regions": None, "source": procedure_file}
+        
+        elif file_entry["type"] == "new":
+            if key in procedure_parser.binary_contents:
+                binary = procedure_parser.binary_contents[key]
+                digest = hashlib.sha256()
+                for data in iter_binary_payload(binary["source"], binary["span"][0], binary["span"][1], binary["encoding"]):
+                    digest.update(data)
+                self._set(path, procedure_file, sha256=digest.hexdigest())
+            elif key in procedure_parser.file_contents:
+                if current is None or (current["exists"] and current["data"] is None):
+                    # 履歴より前からあるファイル（または内容が不明なファイル）は、出力ディレクトリのファイルの形式を引き継ぐ
+                    existing = self._read_baseline(path)
+                else:
+                    existing = current["data"] if current["exists"] else None
+                self._set(path, procedure_file, data=render_text_file(procedure_parser.file_contents[key], existing, path))
+        
+        elif file_entry["type"] == "modify" and key in procedure_parser.file_modifications:
+            modifications = procedure_parser.file_modifications[key]
+            if current is not None and not current["exists"]:
+                # 削除済みのファイルの修正は適用時にもスキップされる
+                return
+            if current is not None and current["data"] is not None:
+                try:
+                    data, _ = splice_modifications(current["data"], path, modifications)
+                    self._set(path, procedure_file, data=data)
+                    return
+                except ValueError as e:
+                    debug_logger.log(f"{path} の修正を再生できません（区間のみ確認します）: {e}")
+            # 元の内容がHowToBookにない場合は、範囲置換で書き込まれた区間のみを確認する
+            regions = dict(current["regions"] or {}) if current else {}
+            self._replay_regions(regions, modifications)
+            self._set(path, procedure_file, regions=regions)
+    
+    def _read_baseline(self, path):
+        """出力ディレクトリのファイルの内容を返す（形式の判定用。ファイルがなければ None）"""
+        full_path = os.path.join(self.output_dir, path)
+        if not os.path.isfile(full_path):
+            return None
+        with open(full_path, 'rb') as f:
+            return f.read()
+    
+    @staticmethod
+    def _replay_regions(regions, modifications):
+        """元の内容が不明なファイルについて、修正で書き込まれた区間のハッシュを更新する"""
+        for mod in modifications:
+            if mod.get("type") == "diff":
+                # 差分は元の内容がなければ再生できないため、以降の区間は確認できない
+                regions.clear()
+                continue
+            start_number, end_number = int(mod["start"][:5]), int(mod["end"][:5])
+            for code in [code for code in regions if start_number <= int(code[:5]) <= end_number]:
+                del regions[code]
+            # 最後のコード管理番号の区間は置換範囲の外に続くため除く
+            for code, region in split_marker_regions(mod["content"])[:-1]:
+                regions.setdefault(code, hashlib.sha256(region.encode('utf-8')).hexdigest())
+    
+    def _set(self, path, procedure_file, data=None, sha256=None, regions=None):
+        """期待するファイルの状態を記録する"""
+        if data is not None:
+            sha256 = hashlib.sha256(data).hexdigest()
+        self.expected[path] = {"exists": True, "data": data, "sha256": sha256, "regions": regions, "source": procedure_file}
+    
+    def _compare(self, path):
+        """1ファイルを比較し、("ok" | "drift" | "unverified", 差異の説明のリスト) を返す"""
+        expected = self.expected[path]
+        full_path = os.path.join(self.output_dir, path)
+        if not expected["exists"]:
+            if os.path.exists(full_path):
+                return "drift", ["削除されたはずのファイルが存在します"]
+            return "ok", []
+        if not os.path.isfile(full_path):
+            return "drift", ["ファイルがありません"]
+        
+        with open(full_path, 'rb') as f:
+            actual = f.read()
+        if expected["sha256"] is not None and hashlib.sha256(actual).hexdigest() == expected["sha256"]:
+            return "ok", []
+        
+        # ファイル全体が一致しない場合（または元の内容が不明な場合）のみ区間ごとに比較する
+        if expected["data"] is not None:
+            expected_regions = hash_marker_regions(normalize_text(expected["data"]))
+        elif expected["regions"] is not None:
+            expected_regions = expected["regions"]
+        else:
+            return "drift", ["内容が異なります"]
+        actual_regions = hash_marker_regions(normalize_text(actual))
+        
+        problems = []
+        for code, digest in expected_regions.items():
+            if code not in actual_regions:
+                problems.append(f"区間 #{code} がありません")
+            elif actual_regions[code] != digest:
+                problems.append(f"区間 #{code} が異なります")
+        if expected["data"] is not None:
+            problems.extend(f"区間 #{code} が追加されています" for code in actual_regions if code not in expected_regions)
+            if not problems:
+                problems.append("内容が異なります（コード管理番号の区間以外、または改行コード・エンコーディング）")
+        elif not expected_regions:
+            return "unverified", []
+        return ("drift" if problems else "ok"), problems
+
+
+def add_apply_arguments(parser):
+    """適用時に共通のコマンドラインオプションを追加する"""
     parser.add_argument('output_dir', help='出力ディレクトリ')
     parser.add_argument('--debug', action='store_true', help='デバッグモードを有効にする')
     parser.add_argument('-y', '--yes', action='store_true', help='確認なしでGitコミットを実行する')
-    args = parser.parse_args()
-    
-    # デバッグモードの設定
+    parser.add_argument('--resume', action='store_true', help='中断された適用をチェックポイントから再開する')
+    parser.add_argument('--verify-syntax', action='store_true', help='書き込んだファイルの構文をコミット前に検証し、エラーがあればロールバックする')
+    parser.add_argument('--only', action='append', metavar='PATTERN',
+                        help='指定したファイルパスのグロブ（例: "api/*"）またはファイルIDに一致するエントリのみ適用する（複数指定可）')
+    parser.add_argument('--exclude', action='append', metavar='PATTERN',
+                        help='指定したファイルパスのグロブまたはファイルIDに一致するエントリを適用しない（複数指定可）')
+    parser.add_argument('--metrics-file', help='実行結果のメトリクスを累積して書き出す Prometheus テキスト形式のファイル（例: /var/lib/node_exporter/textfile/parser.prom）')
+
+def enable_debug(enabled):
+    """デバッグモードの設定"""
     global debug_logger
-    if args.debug:
+    if enabled:
         debug_logger = DebugLogger(enabled=True)
         debug_logger.log("デバッグモードが有効になりました")
-    
-    procedure_file = args.procedure_file
-    output_dir = args.output_dir
-    
-    debug_logger.log(f"手順書ファイル: {procedure_file}")
+
+def run_procedures(procedure_files, output_dir, args, loader=None):
+    """手順書（または適用計画）を出力ディレクトリに適用する"""
+    debug_logger.log(f"手順書ファイル: {', '.join(procedure_files)}")
     debug_logger.log(f"出力ディレクトリ: {output_dir}")
     
     # 除外ファイル拡張子の表示
@@ -869,24 +2598,38 @@ def main():
     howto_dir = os.path.join(os.path.dirname(output_dir), "HowToBook")
     debug_logger.log(f"HowToBookディレクトリ: {howto_dir}")
     
-    # パーサーの初期化と実行
-    procedure_parser = ProcedureParser(procedure_file)
-    procedure_parser.parse()
-    
-    # 手順書コピーの保存
-    with open(procedure_file, 'r', encoding='utf-8') as f:
-        procedure_content = f.read()
-    
-    save_procedure_copy(procedure_content, howto_dir)
+    entry_filter = EntryFilter(args.only, args.exclude)
+    if entry_filter:
+        debug_logger.log(f"絞り込み: {entry_filter.describe()}")
     
-    # サマリー表示
-    procedure_parser.generate_summary()
-    
-    # プロジェクト構造の作成
-    procedure_parser.create_project_structure(output_dir)
-    
-    # Git操作の実行（-yオプションに基づいて確認をスキップするかどうかを決定）
-    procedure_parser.perform_git_operations(output_dir, skip_confirmation=args.yes)
+    status = "failure"
+    started = time.monotonic()
+    try:
+        if loader is None and len(procedure_files) == 1 and is_stream_source(procedure_files[0]):
+            # 標準入力・FIFOの場合は生成中の手順書を読み込みながら適用する
+            if args.resume:
+                print_info("★注意: ストリームからの適用では --resume は使用できません。無視します")
+            applier = StreamingProcedureApplier(procedure_files[0], output_dir, howto_dir,
+                                                skip_confirmation=args.yes, verify_syntax=args.verify_syntax,
+                                                entry_filter=entry_filter or None)
+            applier.run()
+            runner = applier
+        else:
+            # 解析・書き込み・Git操作をパイプラインで実行（-yオプションに基づいて確認をスキップするかどうかを決定）
+            executor = PipelinedExecutor(procedure_files, output_dir, howto_dir, skip_confirmation=args.yes,
+                                         verify_syntax=args.verify_syntax, resume=args.resume, loader=loader,
+                                         entry_filter=entry_filter or None)
+            executor.run()
+            runner = executor
+        # コミットに失敗した場合は、作業ツリーにコミットされていない変更が残るため失敗として記録する
+        status = "failure" if runner.commit_failed else "success"
+    finally:
+        metrics.observe("procedure_parser_stage_duration_seconds", time.monotonic() - started, {"stage": "total"})
+        if args.metrics_file:
+            try:
+                metrics.write(args.metrics_file, status)
+            except OSError as e:
+                print_info(f"★メトリクスの書き出しに失敗しました: {e}")
     
     print_info(f"\n環境構築が完了しました。出力先: {output_dir}")
     print_info("実行コマンドを実行するには、生成された実行スクリプトを使用してください。")
@@ -895,6 +2638,80 @@ def main():
     # デバッグログを閉じる
     debug_logger.close()
 
+def compile_main(argv):
+    """compile コマンド: 手順書を検証・解析して適用計画ファイルを作成する"""
+    parser = argparse.ArgumentParser(prog='parser.py compile', description='手順書を検証・解析して適用計画ファイルを作成する')
+    parser.add_argument('procedure_file', help='手順書ファイルのパス')
+    parser.add_argument('plan_file', help='作成する適用計画ファイルのパス')
+    parser.add_argument('--debug', action='store_true', help='デバッグモードを有効にする')
+    args = parser.parse_args(argv)
+    enable_debug(args.debug)
+    
+    procedure_parser = ProcedureParser(args.procedure_file).parse()
+    save_procedure_plan(compile_procedure_plan(procedure_parser), args.plan_file)
+    print_info(f"適用計画を作成しました: {args.plan_file}（ファイル数: {len(procedure_parser.file_list)}）")
+    debug_logger.close()
+
+def apply_main(argv):
+    """apply コマンド: 適用計画ファイルを手順書の解析なしで適用する"""
+    parser = argparse.ArgumentParser(prog='parser.py apply', description='compile で作成した適用計画ファイルを適用する')
+    parser.add_argument('plan_files', nargs='+', metavar='plan_file', help='適用計画ファイルのパス（複数指定した場合は指定順に適用）')
+    add_apply_arguments(parser)
+    parser.add_argument('--source', help='元の手順書のパス（適用計画に記録されたパスから移動した場合に指定）')
+    args = parser.parse_args(argv)
+    if args.source and len(args.plan_files) > 1:
+        parser.error("--source は適用計画ファイルを1つだけ指定した場合に使用できます")
+    enable_debug(args.debug)
+    
+    entry_filter = EntryFilter(args.only, args.exclude) or None
+    run_procedures(args.plan_files, args.output_dir, args,
+                   loader=lambda plan_file: load_procedure_plan(plan_file, args.source, entry_filter))
+
+def verify_main(argv):
+    """verify コマンド: 出力ディレクトリがHowToBookの手順書の適用結果と一致しているか確認する"""
+    parser = argparse.ArgumentParser(prog='parser.py verify',
+                                     description='HowToBookの手順書をメモリ上で再生し、出力ディレクトリとの差異を報告する（ファイルは変更しない）')
+    parser.add_argument('output_dir', help='出力ディレクトリ')
+    parser.add_argument('--howto', help='HowToBookディレクトリ（省略時は出力ディレクトリの親ディレクトリのHowToBook）')
+    parser.add_argument('--jobs', type=int, help='比較の並列数')
+    parser.add_argument('--debug', action='store_true', help='デバッグモードを有効にする')
+    args = parser.parse_args(argv)
+    enable_debug(args.debug)
+    
+    howto_dir = args.howto or os.path.join(os.path.dirname(args.output_dir), "HowToBook")
+    debug_logger.log(f"HowToBookディレクトリ: {howto_dir}")
+    matched = DriftVerifier(args.output_dir, howto_dir, max_workers=args.jobs).run()
+    debug_logger.close()
+    sys.exit(0 if matched else 1)
+
+# サブコマンド（指定がない場合は手順書を直接適用する）
+COMMANDS = {
+    "compile": compile_main,
+    "apply": apply_main,
+    "verify": verify_main,
+}
+
+def main():
+    argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
+    
+    # コマンドライン引数のパース
+    parser = argparse.ArgumentParser(description='手順書パーサー v2.1.0',
+                                     epilog='サブコマンド: compile（適用計画の作成）, apply（適用計画の適用）, verify（HowToBookとの差異の確認）')
+    parser.add_argument('procedure_files', nargs='+', metavar='procedure_file', help='手順書ファイルのパス（複数指定した場合は指定順に適用。- で標準入力）')
+    add_apply_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if '-' in args.procedure_files and len(args.procedure_files) > 1:
+        parser.error("標準入力（-）は他の手順書と同時に指定できません")
+    if args.procedure_files == ['-'] and not args.yes:
+        parser.error("標準入力から手順書を読み込む場合は -y を指定してください")
+    
+    enable_debug(args.debug)
+    run_procedures(args.procedure_files, args.output_dir, args)
+
 
 if __name__ == "__main__":
     main()